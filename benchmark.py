@@ -1,12 +1,29 @@
+import hashlib
+import os
 import time
 import pandas as pd
 import numpy as np
 from numpy.linalg import norm
 import json
 
+from tracing import tracer, trace_interface
+from profiling import ClientProfiler
+from resource_monitor import ResourceMonitor, add_resources, divide_resources
+from ground_truth import get_ground_truth, get_recall
+from result_store import save_run
+from confidence import summarize, is_converged
+from dim_reduction import fit_reduction, transform_csv
+from datasets import (load_vectors, load_neighbors, get_hdf5_metric,
+                      as_float)
+from workloads import (mixed_workload_test, churn_workload_test, search_test,
+                       async_search_test, query_overhead_test, insert_vectors,
+                       scale_test, get_latency_stats, add_latency_stats,
+                       divide_latency_stats, segment_lifecycle_test,
+                       multi_tenant_test)
 from interfaces.pgvector_interface import PGvectorInterface
 from interfaces.milvus_interface import MilvusInterface
 from interfaces.qdrant_interface import QDrantInterface
+from interfaces.mock_interface import MockInterface
 
 
 def get_data_info(csv_path):
@@ -20,92 +37,421 @@ test_db_interface = [PGvectorInterface]
 test_metric = {
     PGvectorInterface: ["cosine", "l2"],
     MilvusInterface: ["COSINE", "L2"],
-    QDrantInterface: ["Cosine", "L2"]
+    QDrantInterface: ["Cosine", "L2"],
+    MockInterface: ["cosine", "l2"]
 }
 test_index_type = {
     PGvectorInterface: ["hnsw", "ivfflat"],
     MilvusInterface: ["HNSW", "FLAT"],
-    QDrantInterface: ["HNSW"]
+    QDrantInterface: ["HNSW"],
+    MockInterface: ["flat"]
+}
+# inner product metrics, used on normalized vectors in place of cosine
+test_ip_metric = {
+    PGvectorInterface: "ip",
+    MilvusInterface: "IP",
+    QDrantInterface: "Dot",
+    MockInterface: "ip"
+}
+test_compression = {
+    PGvectorInterface: ["none", "halfvec", "binary"],
+    MilvusInterface: ["none", "sq8", "pq"],
+    QDrantInterface: ["none", "scalar", "product", "binary"],
+    MockInterface: ["none"]
+}
+# compressions that come with their own index type, whatever index the
+# cell asks for. They run once per metric, named after the index they build
+compressed_index_type = {
+    MilvusInterface: {"sq8": "IVF_SQ8", "pq": "IVF_PQ"}
 }
 db_name_dict = {
     PGvectorInterface: "PGvector",
     MilvusInterface: "Milvus",
-    QDrantInterface: "QDrant"
+    QDrantInterface: "QDrant",
+    MockInterface: "Mock"
 }
 
 
-def benchmark_test(i, index_type: str, metric: str, db_BM,
-                   db, collection_name, csv_path, test_vector):
+def get_method_name(index_type, metric, compression="none"):
     t_name = f"{index_type.upper()}+{metric.upper()}"
+    if compression != "none":
+        t_name += f"+{compression.upper()}"
+    return t_name
+
+
+def get_filters(metadata):
+    # one filter for every selectivity level of each metadata field, plus
+    # one that combines the most common value of every field
+    filters = {}
+    for field in metadata.columns:
+        counts = metadata[field].value_counts()
+        last_selectivity = None
+        for value, count in counts.items():
+            selectivity = count / len(metadata)
+            if (last_selectivity is None or
+                    selectivity < last_selectivity / 2):
+                filters[f"{field}={value}"] = {field: int(value)}
+                last_selectivity = selectivity
+    if len(metadata.columns) > 1:
+        combined = {field: int(metadata[field].value_counts().index[0])
+                    for field in metadata.columns}
+        name = "+".join(f"{field}={value}"
+                        for field, value in combined.items())
+        filters[name] = combined
+    return filters
+
+
+def get_filtered_ground_truth(train_vector, test_vector, metric, metadata,
+                              k=1):
+    # name -> (filters, selectivity, exact k nearest ids under the filter)
+    filtered_ground_truth = {}
+    for name, filters in get_filters(metadata).items():
+        mask = np.ones(len(metadata), dtype=bool)
+        for field, value in filters.items():
+            mask &= metadata[field].to_numpy() == value
+        subset = np.where(mask)[0]
+        ground_truth = subset[get_ground_truth(train_vector[subset],
+                                               test_vector, metric, k=k)]
+        filtered_ground_truth[name] = (filters, float(np.mean(mask)),
+                                       ground_truth)
+    return filtered_ground_truth
+
+
+resource_phases = ["create", "insert", "index", "search"]
+size_keys = ["total_bytes", "vector_bytes", "index_bytes", "meta_bytes",
+             "bytes_per_vector"]
+
+
+def drop_page_cache():
+    # needs root, returns False when the OS does not allow it
+    try:
+        os.sync()
+        with open("/proc/sys/vm/drop_caches", 'w') as f:
+            f.write("3\n")
+        return True
+    except OSError:
+        return False
+
+
+def cold_start_test(db, collection_name, test_vector, metric, k=1):
+    # reopen the backend with empty caches and time the first queries
+    db.disconnect_server()
+    dropped = drop_page_cache()
+    if not dropped:
+        print("Could not drop the page cache, cold start is only a reconnect")
+    start_time = time.time()
+    db.connect_server()
+    reconnect_time = time.time() - start_time
+
+    start_time = time.time()
+    db.similarity_search(collection_name, test_vector[0, :], metric, k=k)
+    first_query_time = time.time() - start_time
+    for test_i in range(1, test_vector.shape[0]):
+        db.similarity_search(collection_name, test_vector[test_i, :], metric,
+                             k=k)
+    cold_qps = test_vector.shape[0] / (time.time() - start_time)
+    return reconnect_time, first_query_time, cold_qps
+
+
+# arguments that do not change the results of a cell
+resume_keys = ["resume", "max_retries", "retry_backoff", "trace_file",
+               "profile_dir"]
+
+
+def get_config_key(parameters):
+    config = {key: value for key, value in parameters.items()
+              if key not in resume_keys}
+    return hashlib.sha256(json.dumps(config, sort_keys=True,
+                                     default=str).encode()).hexdigest()
+
+
+def save_checkpoint(checkpoint_file, config_key, db_benchmarks):
+    # written to a temporary file first, a crash while writing keeps the
+    # previous checkpoint
+    with open(f"{checkpoint_file}.tmp", 'w', encoding='utf-8') as f:
+        json.dump({"config": config_key, "results": db_benchmarks}, f,
+                  ensure_ascii=False)
+    os.replace(f"{checkpoint_file}.tmp", checkpoint_file)
+
+
+def load_checkpoint(checkpoint_file, config_key):
+    # backend name -> method name -> results of the finished cells
+    if not os.path.exists(checkpoint_file):
+        return {}
+    with open(checkpoint_file, 'r', encoding='utf-8') as f:
+        checkpoint = json.load(f)
+    if checkpoint["config"] != config_key:
+        print("The checkpoint is from another configuration, starting over")
+        return {}
+    return {db_BM["Name"]: db_BM["Methods"]
+            for db_BM in checkpoint["results"]}
+
+
+def get_load_key(db, metric, ip_metric, compression):
+    # methods with the same key can search the same loaded table, the
+    # inner product methods load normalized vectors
+    return (metric == ip_metric,) + tuple(db.get_load_key(metric,
+                                                          compression))
+
+
+adaptive_keys = ["insert_time", "similarity_time"]
+method_keys = ["create_time", "insert_time", "index_time", "index_ready_time",
+               "ingest_time", "similarity_time", "size", "total_distance",
+               "recall", "reconnect_time", "cold_first_query_time",
+               "cold_similarity_time"]
+# measured only by the rounds that load the table, not by reused loads
+load_time_keys = ["create_time", "insert_time", "ingest_time"]
+
+
+def benchmark_test(i, index_type: str, metric: str, db_BM,
+                   db, collection_name, csv_path, test_vector,
+                   monitor=None, profiler=None, index_mode="after",
+                   compression="none", rescore=True, ground_truth=None,
+                   metadata_csv_path=None, filtered_ground_truth=None,
+                   warmup_queries=0, cold_start=False, k=1, k_sweep=None,
+                   async_concurrency=None, normalize=False,
+                   search_results=None, ingest_batch_size=10000,
+                   shared_load=None, load_key=None):
+    # shared_load is the load of the table in the backend, {"key": ...,
+    # "create_time": ..., "insert_time": ..., "ingest_time": ...}. When it
+    # was loaded for load_key only the index is rebuilt and the round has
+    # no load times
+    t_name = get_method_name(index_type, metric, compression)
+    if monitor is None:
+        monitor = ResourceMonitor()
+    if profiler is None:
+        profiler = ClientProfiler()
     if i == 0:
-        db_BM["Methods"][t_name] = {}
-        db_BM["Methods"][t_name]["create_time"] = 0
-        db_BM["Methods"][t_name]["insert_time"] = 0
-        db_BM["Methods"][t_name]["similarity_time"] = 0
-        db_BM["Methods"][t_name]["size"] = 0
-        db_BM["Methods"][t_name]["total_distance"] = 0
+        db_BM["Methods"][t_name] = {key: 0 for key in method_keys}
+        db_BM["Methods"][t_name]["compression"] = compression
+        db_BM["Methods"][t_name]["filtered"] = {}
+        db_BM["Methods"][t_name]["k"] = k
+        db_BM["Methods"][t_name]["k_sweep"] = {}
+        db_BM["Methods"][t_name]["async_search"] = {}
+        db_BM["Methods"][t_name]["search_latency"] = {}
+        # rounds that reused the table of an earlier load, and the load
+        # times of that load
+        db_BM["Methods"][t_name]["reused_loads"] = 0
+        db_BM["Methods"][t_name]["reused_load"] = {}
+        # the values of every single round, the others are averages
+        db_BM["Methods"][t_name]["rounds"] = []
+        db_BM["Methods"][t_name]["size_breakdown"] = {
+            key: 0 for key in size_keys
+        }
+        db_BM["Methods"][t_name]["resources"] = {
+            phase: {} for phase in resource_phases
+        }
+    resources = {phase: {} for phase in resource_phases}
+    round_result = {key: 0 for key in method_keys}
+    train_vector = load_vectors(csv_path)
+    metadata_fields = None
+    metadata = None
+    if metadata_csv_path is not None:
+        metadata = pd.read_csv(metadata_csv_path)
+        metadata_fields = list(metadata.columns)
+        metadata = metadata.to_dict("records")
     print(f"Round {i+1} start")
 
-    db.drop_table(collection_name)
-    # print(index_type, metric)
+    reuse = shared_load is not None and shared_load.get("key") == load_key
+    if reuse:
+        with tracer.span("reset_index"):
+            db.reset_index(collection_name, metric, compression, rescore)
+        # this round did not load, its samples leave the load times out
+        for key in load_time_keys:
+            round_result.pop(key)
+        db_BM["Methods"][t_name]["reused_load"] = {
+            key: shared_load[key] for key in load_time_keys}
+        db_BM["Methods"][t_name]["reused_loads"] += 1
+    else:
+        with tracer.span("drop"):
+            db.drop_table(collection_name)
+        # print(index_type, metric)
 
-    # create table
-    start_time = time.time()
-    db.create_table(collection_name, test_vector.shape[1], metric=metric,
-                    index_types=index_type)
-    db_BM["Methods"][t_name]["create_time"] += (time.time() -
-                                                start_time)
+        # create table, the index is built in its own phase
+        with tracer.span("create"), monitor.phase(resources["create"]), \
+                profiler.phase("create"):
+            start_time = time.time()
+            db.create_table(collection_name, test_vector.shape[1],
+                            metric=metric, index_types=index_type,
+                            build_index=False, compression=compression,
+                            rescore=rescore, metadata_fields=metadata_fields)
+            create_time = time.time() - start_time
+        round_result["create_time"] = create_time
+
+    index_time = 0
+    if index_mode == "before" and not reuse:
+        print("indexing")
+        with tracer.span("index"), monitor.phase(resources["index"]), \
+                profiler.phase("index"):
+            start_time = time.time()
+            db.indexing_data(collection_name, metric, index_type)
+            index_time = time.time() - start_time
 
-    # prepare data
-    data = db.transfer_csv(csv_path)
     # insert data
-    start_time = time.time()
-    db.insert_vector_from_csv(collection_name, data)
-    if index_type == "ivfflat" or db_BM["Name"] == "Milvus":
-        # if index_type == "ivfflat":
-        #     pass
+    if not reuse:
+        with tracer.span("insert"), monitor.phase(resources["insert"]), \
+                profiler.phase("insert"):
+            insert_time = insert_vectors(db, collection_name, train_vector,
+                                         batch_size=ingest_batch_size,
+                                         normalize=normalize,
+                                         metadata=metadata)
+        round_result["insert_time"] = train_vector.shape[0] / insert_time
+        if shared_load is not None:
+            shared_load.update(key=load_key,
+                               create_time=round_result["create_time"],
+                               insert_time=round_result["insert_time"])
+
+    if index_mode == "after" or reuse:
         print("indexing")
-        db.indexing_data(collection_name, metric, index_type)
-    db_BM["Methods"][t_name]["insert_time"] += (
-        len(data) / (time.time() - start_time)
-    )
+        with tracer.span("index"), monitor.phase(resources["index"]), \
+                profiler.phase("index"):
+            start_time = time.time()
+            db.indexing_data(collection_name, metric, index_type)
+            index_time = time.time() - start_time
+
+    # time until the index covers every inserted vector
+    with tracer.span("index_ready"):
+        start_time = time.time()
+        if not db.wait_index_ready(collection_name):
+            print("Index was not ready before the timeout")
+        index_ready_time = time.time() - start_time
+
+    round_result["index_time"] = index_time
+    round_result["index_ready_time"] = index_ready_time
+    if not reuse:
+        round_result["ingest_time"] = (
+            train_vector.shape[0] / round_result["insert_time"] +
+            index_time + index_ready_time)
+        if shared_load is not None:
+            shared_load["ingest_time"] = round_result["ingest_time"]
 
     # size of table
-    db_BM["Methods"][t_name]["size"] += db.get_size_of_table(
-        collection_name
-    )
+    with tracer.span("size"):
+        size_breakdown = db.get_size_breakdown(collection_name)
+    round_result["size"] = size_breakdown["total_bytes"]
+    for key in size_keys:
+        if (size_breakdown[key] is None or
+                db_BM["Methods"][t_name]["size_breakdown"][key] is None):
+            # the backend can not measure this part, see the note
+            db_BM["Methods"][t_name]["size_breakdown"][key] = None
+        else:
+            db_BM["Methods"][t_name]["size_breakdown"][key] += \
+                size_breakdown[key]
+    if "note" in size_breakdown:
+        db_BM["Methods"][t_name]["size_breakdown"]["note"] = \
+            size_breakdown["note"]
+
+    # cold start: reconnect with dropped caches before any query
+    if cold_start:
+        with tracer.span("cold_start"):
+            (round_result["reconnect_time"],
+             round_result["cold_first_query_time"],
+             round_result["cold_similarity_time"]) = cold_start_test(
+                db, collection_name, test_vector, metric, k=k)
+
+    # warm-up queries, not timed
+    with tracer.span("warmup"):
+        for test_i in range(warmup_queries):
+            db.similarity_search(
+                collection_name,
+                test_vector[test_i % test_vector.shape[0], :], metric, k=k)
 
-    distances_total = 0
     # similarity_search
-    start_time = time.time()
-    for test_i in range(test_vector.shape[0]):
-        id, _ = db.similarity_search(
-            collection_name,
-            test_vector[test_i, :],
-            metric
-        )
-        # print(f"{dist = }")
-        # print(data[id])
-        B = test_vector[test_i, :]
-        if db_BM["Name"] == "PGvector":
-            A = data[id][1]
-        elif db_BM["Name"] == "QDrant":
-            A = data[id].vector
-        else:
-            A = data[id]["vector"]
+    result_ids = []
+    latencies = []
+    with tracer.span("search"), monitor.phase(resources["search"]), \
+            profiler.phase("search"):
+        start_time = time.time()
+        for test_i in range(test_vector.shape[0]):
+            query_start_time = time.time()
+            ids, _ = db.similarity_search(
+                collection_name,
+                test_vector[test_i, :],
+                metric,
+                k=k
+            )
+            latencies.append(time.time() - query_start_time)
+            result_ids.append(ids)
+        search_time = time.time() - start_time
+    add_latency_stats(db_BM["Methods"][t_name]["search_latency"],
+                      get_latency_stats(latencies))
+    if search_results is not None:
+        search_results[t_name] = result_ids
 
-        if metric.upper() == "COSINE":
-            distances_total += np.dot(A, B)/(norm(A)*norm(B))
-        else:
-            distances_total += norm(A-B)
-        # print(f"{npdist = }")
+    distances_total = 0
+    with tracer.span("quality"):
+        for test_i, ids in enumerate(result_ids):
+            id = ids[0]
+            B = test_vector[test_i, :]
+            A = as_float(train_vector[id])
+            if normalize:
+                A = A / norm(A)
+
+            if metric.upper() == "COSINE":
+                distances_total += np.dot(A, B)/(norm(A)*norm(B))
+            elif metric.upper() in ["IP", "DOT"]:
+                # normalized vectors, the inner product is the cosine
+                distances_total += np.dot(A, B)
+            else:
+                distances_total += norm(A-B)
+            # print(f"{npdist = }")
+
+    round_result["similarity_time"] = test_vector.shape[0] / search_time
+    round_result["total_distance"] = float(distances_total /
+                                           test_vector.shape[0])
+
+    if ground_truth is not None:
+        round_result["recall"] = get_recall(result_ids, ground_truth, k)
+
+    for key in method_keys:
+        if key in round_result:
+            db_BM["Methods"][t_name][key] += round_result[key]
+    db_BM["Methods"][t_name]["rounds"].append(round_result)
 
-    db_BM["Methods"][t_name]["similarity_time"] += (
-        test_vector.shape[0] / (time.time() - start_time)
-    )
+    # filtered kNN at every selectivity
+    for name, (filters, selectivity, filtered_truth) in \
+            (filtered_ground_truth or {}).items():
+        with tracer.span("filtered_search", filter=name):
+            qps, recall = search_test(db, collection_name, test_vector,
+                                      metric, filtered_truth,
+                                      filters=filters, k=k)
+        filtered = db_BM["Methods"][t_name]["filtered"].setdefault(
+            name, {"selectivity": selectivity, "similarity_time": 0,
+                   "recall": 0})
+        filtered["similarity_time"] += qps
+        filtered["recall"] += recall
+        print(f"{name} ({selectivity:.4f}): {qps = }, {recall = }")
 
-    db_BM["Methods"][t_name]["total_distance"] += (distances_total /
-                                                   test_vector.shape[0])
+    # search speed and recall@k for every k of the sweep
+    if ground_truth is not None:
+        for sweep_k in k_sweep or []:
+            with tracer.span("k_sweep", k=sweep_k):
+                qps, recall = search_test(db, collection_name, test_vector,
+                                          metric, ground_truth, k=sweep_k)
+            sweep = db_BM["Methods"][t_name]["k_sweep"].setdefault(
+                str(sweep_k), {"similarity_time": 0, "recall": 0})
+            sweep["similarity_time"] += qps
+            sweep["recall"] += recall
+            print(f"k = {sweep_k}: {qps = }, {recall = }")
+
+    # pipelined search from an asyncio client at every concurrency
+    if ground_truth is not None:
+        for concurrency in async_concurrency or []:
+            with tracer.span("async_search", concurrency=concurrency):
+                qps, recall, latency = async_search_test(
+                    db, collection_name, test_vector, metric, ground_truth,
+                    concurrency=concurrency, k=k)
+            pipelined = db_BM["Methods"][t_name]["async_search"].setdefault(
+                str(concurrency), {"similarity_time": 0, "recall": 0,
+                                   "latency": 0})
+            pipelined["similarity_time"] += qps
+            pipelined["recall"] += recall
+            pipelined["latency"] += latency["mean"]
+            print(f"{concurrency} in flight: {qps = }, {recall = }")
+
+    for phase in resource_phases:
+        add_resources(db_BM["Methods"][t_name]["resources"][phase],
+                      resources[phase])
 
     # others ...
     print(f"{distances_total = }")
@@ -125,14 +471,172 @@ def Benchmark(
     pg_username='billyslim',
     pg_password='',
     milvus_db_path='milvus_db/milvus_demo.db',
-    qdrant_db_path='./qdrant_data'
+    qdrant_db_path='./qdrant_data',
+    server_pids=None,
+    resource_interval=0.05,
+    index_mode="after",
+    compression_sweep=False,
+    rescore=True,
+    metadata_csv_path=None,
+    mixed_workload=None,
+    churn_workload=None,
+    results_db_path="./result/results.db",
+    adaptive=False,
+    ci_target=0.05,
+    max_rounds=20,
+    time_budget=None,
+    warmup_queries=0,
+    cold_start=False,
+    k=1,
+    k_sweep=None,
+    async_concurrency=None,
+    pg_prepared=True,
+    pg_session_settings=None,
+    query_overhead=False,
+    normalize=False,
+    reduction=None,
+    reduction_dims=None,
+    reduction_chunk_size=10000,
+    ground_truth_paths=None,
+    neighbors_path=None,
+    ingest_batch_size=10000,
+    scale_checkpoints=None,
+    resume=False,
+    max_retries=2,
+    retry_backoff=5,
+    trace_file=None,
+    profile_dir=None,
+    reuse_loads=False,
+    mock_backend=None,
+    milvus_nlist=128,
+    milvus_search_params=None,
+    milvus_lifecycle=False,
+    multi_tenant=None
 ):
-    train_data_shape = get_data_info(csv_path)
-    test_data_shape = get_data_info(test_csv_path)
-    test_vector = pd.read_csv(test_csv_path)
-    test_vector = test_vector.to_numpy()
+    # every run is also appended to the results_db_path history
+    parameters = {key: value for key, value in locals().items()
+                  if key != "pg_password"}
+    # the resources are sampled from this process, the server_pids (e.g.
+    # the postmaster) and every child of them, like the Milvus Lite server
+    # and the postgres backend of each connection
+    # mixed_workload is a dict of mixed_workload_test settings, e.g.
+    # {"insert_rate": 100, "batch_size": 10, "num_searchers": 2,
+    #  "duration": 10}, it runs on the collection of the last round.
+    # churn_workload works the same way with churn_workload_test settings.
+    # With adaptive, rounds are added after test_round until the relative
+    # 95% confidence interval of insert and search speed is below
+    # ci_target, max_rounds is reached or time_budget seconds have passed.
+    # warmup_queries untimed queries run before the search phase, and
+    # cold_start reopens the backend (dropping the OS page cache when
+    # running as root) and times the first queries separately.
+    # Every search asks for the k nearest vectors and the recall is
+    # recall@k, k_sweep (e.g. (1, 10, 100, 1000)) adds the search speed
+    # and recall@k of each k to the results.
+    # async_concurrency (e.g. (1, 4, 16)) repeats the search from an
+    # asyncio client that keeps that many queries in flight.
+    # pg_prepared runs the pgvector searches as prepared statements and
+    # pg_session_settings are SET on every pgvector connection, e.g.
+    # {"hnsw.ef_search": 100, "ivfflat.probes": 10, "jit": "off"}.
+    # query_overhead splits the pgvector query time into client and
+    # server time, with and without prepared statements.
+    # normalize adds a run of every cosine method on L2-normalized vectors
+    # with the inner product metric of the backend and compares the two.
+    # reduction ("pca", "gaussian" or "sparse") runs the benchmark once on
+    # the original vectors and once for every dimension in reduction_dims,
+    # see reduction_benchmark. ground_truth_paths (train and test csv)
+    # gives the vectors of the exact neighbours if they are not the loaded
+    # ones, e.g. the original vectors of a reduced run.
+    # csv_path and test_csv_path can also be .fvecs/.bvecs files or one
+    # ann-benchmarks .hdf5 file for both. neighbors_path (.ivecs or .hdf5,
+    # the HDF5 dataset itself by default) gives the exact neighbours that
+    # ship with the dataset, they are used for the metric they were made
+    # for (L2 for .ivecs). Vectors are inserted ingest_batch_size at a time.
+    # scale_checkpoints (e.g. (10000, 100000, 1000000)) grows one
+    # collection and measures search speed, latency, recall and size each
+    # time it reaches a checkpoint, see scale_test.
+    # Every finished cell (backend and method) is saved to
+    # result_file + ".checkpoint", resume skips the cells saved there by a
+    # run with the same configuration. A failed cell is retried
+    # max_retries times after retry_backoff, 2 * retry_backoff, ...
+    # seconds, its last error goes to "Errors" of the backend.
+    # trace_file records a span for every phase and interface call and
+    # writes them as Chrome trace events, with a summary table next to it
+    # profile_dir profiles the create, insert, index and search phases and
+    # writes a report per backend there: the share of the wall time spent
+    # in the harness, the interface, the client library, other code (numpy,
+    # pandas, ...) and waiting on I/O, see profiling.py
+    # reuse_loads loads the data once into every backend and only swaps
+    # the index for the next round or method as long as the backend can
+    # keep the loaded rows (see get_load_key of the interfaces). The load
+    # times are averaged over the rounds that loaded, a method that only
+    # reused loads reports the load it reused
+    # mock_backend adds a backend that keeps no data and answers after
+    # an injected latency, e.g. {"latency": {"search": 0.001},
+    # "distribution": "exponential"} or {} to answer at once. Its speed
+    # is the ceiling of the harness, its recall is not meaningful
+    # milvus_nlist is the nlist of the IVF indexes and milvus_search_params
+    # the params of every Milvus search, e.g. {"nprobe": 16} or
+    # {"ef": 64}. milvus_lifecycle times flush, load, release and
+    # compaction and compares searches on growing and sealed segments,
+    # see segment_lifecycle_test
+    # multi_tenant is a dict of multi_tenant_test settings, e.g.
+    # {"tenant_counts": (1, 10, 100, 1000),
+    #  "layouts": ("collections", "shared")}, it compares one collection
+    # per tenant with one shared collection as the number of tenants grows
+    # index_mode "after" loads the data then builds the index,
+    # "before" builds the index on the empty table and loads into it
+    assert index_mode in ["before", "after"]
+    if reduction is not None:
+        return reduction_benchmark(dict(parameters, pg_password=pg_password))
+    # binary datasets stay memory-mapped, the test vectors are loaded
+    train_vector = load_vectors(csv_path)
+    train_data_shape = train_vector.shape
+    test_vector = as_float(load_vectors(test_csv_path, part="test"))
+    test_data_shape = test_vector.shape
+    normalized_train = None
+    normalized_test = None
+    if normalize:
+        normalized_train = as_float(train_vector)
+        normalized_train = normalized_train / norm(normalized_train, axis=1,
+                                                   keepdims=True)
+        normalized_test = test_vector / norm(test_vector, axis=1,
+                                             keepdims=True)
+    truth_train = train_vector
+    truth_test = test_vector
+    if ground_truth_paths is not None:
+        truth_train = load_vectors(ground_truth_paths[0])
+        truth_test = as_float(load_vectors(ground_truth_paths[1],
+                                           part="test"))
+
+    def get_truth_vectors(normalized):
+        # vectors of the exact neighbours, normalized for the inner product.
+        # get_ground_truth converts the train rows chunk by chunk, only the
+        # normalized copy is read into memory at once
+        if not normalized:
+            return truth_train, truth_test
+        gt_train = as_float(truth_train)
+        return (gt_train / norm(gt_train, axis=1, keepdims=True),
+                truth_test / norm(truth_test, axis=1, keepdims=True))
+
+    if neighbors_path is None and csv_path.endswith((".hdf5", ".h5")):
+        neighbors_path = csv_path
+    shipped_neighbors = None
+    if neighbors_path is not None:
+        shipped_neighbors = load_neighbors(neighbors_path)
+        shipped_metric = "L2"
+        if neighbors_path.endswith((".hdf5", ".h5")):
+            shipped_metric = get_hdf5_metric(neighbors_path)
     db_benchmarks = []
 
+    if trace_file is not None:
+        tracer.enable()
+
+    checkpoint_file = f"{result_file}.checkpoint"
+    config_key = get_config_key(parameters)
+    done_cells = {}
+    if resume:
+        done_cells = load_checkpoint(checkpoint_file, config_key)
+
     print("Start Benchmark process")
     print("#"*40)
     print("Informaton of dataset")
@@ -155,19 +659,45 @@ def Benchmark(
     if len(pg_dbname) > 0 or len(pg_username) > 0:
         test_interfaces.append(PGvectorInterface)
         print("Added PGvectorInterface to the test.")
+    if mock_backend is not None:
+        test_interfaces.append(MockInterface)
+        print("Added MockInterface to the test.")
+
+    # postgres runs as a separate server, pass its pids to sample it too
+    monitor = ResourceMonitor(server_pids, interval=resource_interval)
+    profiler = ClientProfiler(enabled=profile_dir is not None)
+
+    # exact neighbours for the recall, one per metric
+    ground_truths = {}
+    filtered_ground_truths = {}
+    metadata = None
+    metadata_records = None
+    metadata_fields = None
+    if metadata_csv_path is not None:
+        metadata = pd.read_csv(metadata_csv_path)
+        assert len(metadata) == train_data_shape[0]
+        # rows written by the workloads carry metadata like the loaded ones
+        metadata_records = metadata.to_dict("records")
+        metadata_fields = list(metadata.columns)
 
     total_start_time = time.time()
 
     for db_interface in test_interfaces:
         # print(db_name_dict[db_interface])
         if db_interface == PGvectorInterface:
-            db = db_interface(pg_dbname, pg_username)
+            db = db_interface(pg_dbname, pg_username, pg_password,
+                              prepared=pg_prepared,
+                              session_settings=pg_session_settings)
         elif db_interface == MilvusInterface:
-            db = db_interface(milvus_db_path)
+            db = db_interface(milvus_db_path, nlist=milvus_nlist,
+                              search_params=milvus_search_params)
         elif db_interface == QDrantInterface:
             db = db_interface(qdrant_db_path)
+        elif db_interface == MockInterface:
+            db = db_interface(**mock_backend)
         else:
             continue
+        db = trace_interface(db)
 
         db_BM = {
             "Name": db_name_dict[db_interface],
@@ -180,29 +710,322 @@ def Benchmark(
                 "dimension": test_data_shape[1]
             },
             "Test round": test_round,
-            "Methods": {}
+            "Index mode": index_mode,
+            "Rescore": rescore,
+            "Methods": {},
+            # cells that failed after every retry
+            "Errors": {}
         }
 
-        for index_type in test_index_type[db_interface]:
-            for metric in test_metric[db_interface]:
-                print("#"*40)
-                print(f"{db_name_dict[db_interface]}")
-                print(f"{index_type = } and {metric = }")
-                for i in range(test_round):
-                    round_strat_time = time.time()
-                    db_BM = benchmark_test(i, index_type, metric,
-                                           db_BM, db, collection_name,
-                                           csv_path, test_vector)
-                    print(f"Round {i+1} spent {time.time()-round_strat_time}")
-                t_name = f"{index_type.upper()}+{metric.upper()}"
-                db_BM["Methods"][t_name]["create_time"] /= test_round
-                db_BM["Methods"][t_name]["insert_time"] /= test_round
-                db_BM["Methods"][t_name]["similarity_time"] /= test_round
-                db_BM["Methods"][t_name]["size"] /= test_round
-                db_BM["Methods"][t_name]["total_distance"] /= test_round
-
-        db.drop_table(collection_name)
-        db.disconnect_server()
+        compressions = ["none"]
+        if compression_sweep:
+            compressions = test_compression[db_interface]
+        if db_interface == QDrantInterface and len(compressions) > 1:
+            # qdrant runs in local mode, which searches the full vectors
+            # and ignores quantization. Its compressed cells would repeat
+            # the uncompressed one under another name
+            reason = "qdrant local mode ignores quantization"
+            db_BM["Skipped compressions"] = {
+                "compressions": compressions[1:],
+                "reason": reason
+            }
+            print(f"Skipping {compressions[1:]}, {reason}")
+            compressions = ["none"]
+        methods = [(index_type, metric, compression)
+                   for index_type in test_index_type[db_interface]
+                   for metric in test_metric[db_interface]
+                   for compression in compressions]
+        if normalize:
+            methods += [(index_type, test_ip_metric[db_interface],
+                         compression)
+                        for index_type in test_index_type[db_interface]
+                        for compression in compressions]
+        index_types = compressed_index_type.get(db_interface, {})
+        if any(compression in index_types for compression in compressions):
+            # e.g. HNSW+L2+SQ8 and FLAT+L2+SQ8 would both build IVF_SQ8,
+            # it runs once as IVF_SQ8+L2+SQ8
+            db_BM["Compressed index types"] = {
+                compression: index_types[compression]
+                for compression in compressions
+                if compression in index_types}
+            methods = list(dict.fromkeys(
+                (index_types.get(compression, index_type), metric,
+                 compression)
+                for index_type, metric, compression in methods))
+        # last round result ids of every method, for the comparison
+        search_results = {}
+        # the table that is loaded in the backend, see benchmark_test
+        shared_load = None
+        if reuse_loads and index_mode == "after":
+            shared_load = {}
+            load_keys = [get_load_key(db, metric, test_ip_metric[db_interface],
+                                      compression)
+                         for _, metric, compression in methods]
+            # cells with the same load run one after the other
+            methods = [method for _, method in sorted(
+                zip(load_keys, methods),
+                key=lambda item: load_keys.index(item[0]))]
+
+        def run_method(index_type, metric, compression):
+            print("#"*40)
+            print(f"{db_name_dict[db_interface]}")
+            print(f"{index_type = }, {metric = } and {compression = }")
+            normalized = metric == test_ip_metric[db_interface]
+            method_train = normalized_train if normalized else train_vector
+            method_test = normalized_test if normalized else test_vector
+            max_k = max([k] + list(k_sweep or []))
+            if metric.upper() not in ground_truths:
+                if (shipped_neighbors is not None and
+                        shipped_neighbors.shape[1] >= max_k and
+                        (metric.upper() == shipped_metric or
+                         (normalized and shipped_metric == "COSINE"))):
+                    # the neighbours that ship with the dataset
+                    ground_truths[metric.upper()] = \
+                        shipped_neighbors[:, :max_k]
+                else:
+                    gt_train, gt_test = get_truth_vectors(normalized)
+                    ground_truths[metric.upper()] = get_ground_truth(
+                        gt_train, gt_test, metric, k=max_k)
+                if metadata is not None:
+                    gt_train, gt_test = get_truth_vectors(normalized)
+                    filtered_ground_truths[metric.upper()] = \
+                        get_filtered_ground_truth(gt_train, gt_test,
+                                                  metric, metadata, k=k)
+            t_name = get_method_name(index_type, metric, compression)
+            method_start_time = time.time()
+            i = 0
+            while True:
+                round_strat_time = time.time()
+                with tracer.span("round", backend=db_BM["Name"],
+                                 method=t_name, round=i + 1):
+                    benchmark_test(
+                        i, index_type, metric, db_BM, db, collection_name,
+                        csv_path, method_test, monitor=monitor,
+                        profiler=profiler,
+                        index_mode=index_mode, compression=compression,
+                        rescore=rescore,
+                        ground_truth=ground_truths[metric.upper()],
+                        metadata_csv_path=metadata_csv_path,
+                        filtered_ground_truth=filtered_ground_truths.get(
+                            metric.upper()),
+                        warmup_queries=warmup_queries, cold_start=cold_start,
+                        k=k, k_sweep=k_sweep,
+                        async_concurrency=async_concurrency,
+                        normalize=normalized, search_results=search_results,
+                        ingest_batch_size=ingest_batch_size,
+                        shared_load=shared_load,
+                        load_key=get_load_key(db, metric,
+                                              test_ip_metric[db_interface],
+                                              compression))
+                print(f"Round {i+1} spent {time.time()-round_strat_time}")
+                i += 1
+                # adaptive mode adds rounds until the confidence intervals
+                # are narrow enough or the time budget is used up
+                if i < test_round:
+                    continue
+                if not adaptive or i >= max_rounds:
+                    break
+                if (time_budget is not None and
+                        time.time() - method_start_time >= time_budget):
+                    break
+                if is_converged(db_BM["Methods"][t_name]["rounds"],
+                                adaptive_keys, ci_target):
+                    break
+            rounds_done = i
+            # the load times and resources are averaged over the rounds
+            # that loaded. When every round reused an earlier load, that
+            # load is reported once
+            loaded_rounds = rounds_done - \
+                db_BM["Methods"][t_name]["reused_loads"]
+
+            for key in method_keys:
+                if key not in load_time_keys:
+                    db_BM["Methods"][t_name][key] /= rounds_done
+                elif loaded_rounds > 0:
+                    db_BM["Methods"][t_name][key] /= loaded_rounds
+                else:
+                    db_BM["Methods"][t_name][key] = \
+                        db_BM["Methods"][t_name]["reused_load"][key]
+            for key in size_keys:
+                if db_BM["Methods"][t_name]["size_breakdown"][key] is None:
+                    continue
+                db_BM["Methods"][t_name]["size_breakdown"][key] /= \
+                    rounds_done
+            for phase in resource_phases:
+                phase_rounds = rounds_done
+                if phase in ["create", "insert"]:
+                    phase_rounds = loaded_rounds
+                if phase_rounds > 0:
+                    divide_resources(
+                        db_BM["Methods"][t_name]["resources"][phase],
+                        phase_rounds)
+            for filtered in db_BM["Methods"][t_name]["filtered"].values():
+                filtered["similarity_time"] /= rounds_done
+                filtered["recall"] /= rounds_done
+            for sweep in db_BM["Methods"][t_name]["k_sweep"].values():
+                sweep["similarity_time"] /= rounds_done
+                sweep["recall"] /= rounds_done
+            for pipelined in \
+                    db_BM["Methods"][t_name]["async_search"].values():
+                for key in pipelined:
+                    pipelined[key] /= rounds_done
+            divide_latency_stats(db_BM["Methods"][t_name]["search_latency"],
+                                 rounds_done)
+            db_BM["Methods"][t_name]["test_round"] = rounds_done
+            db_BM["Methods"][t_name]["stats"] = {}
+            for key in method_keys:
+                samples = [r[key] for r in db_BM["Methods"][t_name]["rounds"]
+                           if key in r]
+                if len(samples) > 0:
+                    db_BM["Methods"][t_name]["stats"][key] = \
+                        summarize(samples)
+
+            if normalized:
+                # against native cosine on the original vectors
+                cosine_metric = [m for m in test_metric[db_interface]
+                                 if m.upper() == "COSINE"][0]
+                cosine_name = get_method_name(index_type, cosine_metric,
+                                              compression)
+                if (cosine_name in db_BM["Methods"] and
+                        cosine_name in search_results):
+                    cosine = db_BM["Methods"][cosine_name]
+                    method = db_BM["Methods"][t_name]
+                    same = np.mean([
+                        np.array_equal(ids, cosine_ids) for ids, cosine_ids
+                        in zip(search_results[t_name],
+                               search_results[cosine_name])])
+                    method["cosine_comparison"] = {
+                        "method": cosine_name,
+                        "same_results": float(same),
+                        "similarity_time_ratio":
+                            method["similarity_time"] /
+                            cosine["similarity_time"],
+                        "index_time_ratio":
+                            method["index_time"] / cosine["index_time"]
+                            if cosine["index_time"] > 0 else 0
+                    }
+                    print(f"{method['cosine_comparison'] = }")
+
+            if query_overhead and db_interface == PGvectorInterface:
+                print("Client and server time per query")
+                result = query_overhead_test(db, collection_name,
+                                             method_test, metric, k=k)
+                for name, overhead in result.items():
+                    print(f"{name}: {overhead}")
+                db_BM["Methods"][t_name]["query_overhead"] = result
+
+            # the workloads below change the rows or drop the table
+            if (shared_load is not None and
+                    (mixed_workload is not None or
+                     churn_workload is not None or
+                     scale_checkpoints is not None or
+                     milvus_lifecycle or multi_tenant is not None)):
+                shared_load.clear()
+
+            if mixed_workload is not None:
+                print("Mixed read/write workload")
+                result = mixed_workload_test(db, collection_name, metric,
+                                             method_train, method_test,
+                                             metadata=metadata_records,
+                                             normalize=normalized,
+                                             **mixed_workload)
+                print(f"{result['insert_rate'] = }, {result['search_qps'] = }")
+                db_BM["Methods"][t_name]["mixed_workload"] = result
+
+            if churn_workload is not None:
+                # the mixed workload adds rows, start from a fresh load
+                if mixed_workload is not None:
+                    db.drop_table(collection_name)
+                    db.create_table(collection_name, method_test.shape[1],
+                                    metric=metric, index_types=index_type,
+                                    build_index=False,
+                                    compression=compression, rescore=rescore,
+                                    metadata_fields=metadata_fields)
+                    insert_vectors(db, collection_name, train_vector,
+                                   batch_size=ingest_batch_size,
+                                   normalize=normalized,
+                                   metadata=metadata_records)
+                    db.indexing_data(collection_name, metric, index_type)
+                    db.wait_index_ready(collection_name)
+                print("Update and delete churn workload")
+                db_BM["Methods"][t_name]["churn_workload"] = \
+                    churn_workload_test(db, collection_name, metric,
+                                        method_train, method_test,
+                                        metadata=metadata_records,
+                                        normalize=normalized,
+                                        **churn_workload)
+
+            if milvus_lifecycle and db_interface == MilvusInterface:
+                print("Growing and sealed segments")
+                result = segment_lifecycle_test(
+                    db, collection_name, metric, index_type, method_train,
+                    method_test, ground_truths[metric.upper()], k=k,
+                    batch_size=ingest_batch_size, compression=compression)
+                for state in ["growing", "sealed"]:
+                    print(f"{state}: qps = {result[state]['similarity_time']}"
+                          f", recall = {result[state]['recall']}")
+                db_BM["Methods"][t_name]["segment_lifecycle"] = result
+
+            if multi_tenant is not None:
+                print("Multi-tenant layouts")
+                db_BM["Methods"][t_name]["multi_tenant"] = multi_tenant_test(
+                    db, collection_name, metric, index_type, method_train,
+                    method_test, k=k, batch_size=ingest_batch_size,
+                    compression=compression, monitor=monitor,
+                    **multi_tenant)
+
+            if scale_checkpoints is not None:
+                print("Scale sweep")
+                db_BM["Methods"][t_name]["scale_sweep"] = scale_test(
+                    db, collection_name, metric, index_type, method_train,
+                    method_test, scale_checkpoints, k=k,
+                    batch_size=ingest_batch_size, compression=compression,
+                    rescore=rescore)
+
+        for index_type, metric, compression in methods:
+            t_name = get_method_name(index_type, metric, compression)
+            if t_name in done_cells.get(db_BM["Name"], {}):
+                print(f"{db_BM['Name']} {t_name} is done, skipping")
+                db_BM["Methods"][t_name] = done_cells[db_BM["Name"]][t_name]
+                continue
+            # retry a failed cell with exponential backoff, the connection
+            # may be gone so it is opened again. A failed reconnect counts
+            # as a failed attempt
+            for attempt in range(max_retries + 1):
+                try:
+                    if attempt > 0:
+                        try:
+                            db.disconnect_server()
+                        except Exception:
+                            pass
+                        db.connect_server()
+                    run_method(index_type, metric, compression)
+                    db_BM["Errors"].pop(t_name, None)
+                    break
+                except Exception as e:
+                    print(f"{db_BM['Name']} {t_name} failed: {e}")
+                    db_BM["Methods"].pop(t_name, None)
+                    if shared_load is not None:
+                        shared_load.clear()
+                    db_BM["Errors"][t_name] = {"error": repr(e),
+                                               "attempts": attempt + 1}
+                    if attempt == max_retries:
+                        break
+                    time.sleep(retry_backoff * 2 ** attempt)
+            save_checkpoint(checkpoint_file, config_key,
+                            db_benchmarks + [db_BM])
+
+        try:
+            db.drop_table(collection_name)
+            db.disconnect_server()
+        except Exception as e:
+            # the backend is still down, its errors are recorded above
+            print(f"{db_BM['Name']} cleanup failed: {e}")
+        if profile_dir is not None:
+            db_BM["Profile"] = profiler.summary()
+            print(profiler.report(db_BM["Name"]))
+            profiler.write_report(db_BM["Name"], profile_dir)
+            profiler.reset()
         # print(db_BM)
         db_benchmarks.append(db_BM.copy())
 
@@ -211,7 +1034,86 @@ def Benchmark(
 
     with open(result_file, 'w', encoding='utf-8') as f:
         json.dump(db_benchmarks, f, ensure_ascii=False, indent=4)
+    if os.path.exists(checkpoint_file):
+        os.remove(checkpoint_file)
+
+    if trace_file is not None:
+        tracer.disable()
+        tracer.export_chrome(trace_file)
+        summary_table = tracer.summary_table()
+        print(summary_table)
+        with open(f"{os.path.splitext(trace_file)[0]}_summary.txt", 'w',
+                  encoding='utf-8') as f:
+            f.write(summary_table + "\n")
 
+    if results_db_path:
+        run_id = save_run(db_benchmarks, parameters,
+                          [csv_path, test_csv_path, metadata_csv_path],
+                          total_start_time, db_path=results_db_path)
+        print(f"Saved run {run_id} to {results_db_path}")
+
+    return 0
+
+
+tradeoff_keys = ["insert_time", "index_time", "similarity_time", "size",
+                 "recall"]
+
+
+def reduction_benchmark(kwargs):
+    # kwargs are the Benchmark arguments. One run on the original vectors
+    # and one for every target dimension, the recall always counts the
+    # exact neighbours of the original vectors. The result file gets the
+    # speed, size and recall of every dimension, the full results of each
+    # run go next to it
+    reduction = kwargs.pop("reduction")
+    reduction_dims = kwargs.pop("reduction_dims") or []
+    chunk_size = kwargs.pop("reduction_chunk_size")
+    csv_path = kwargs["csv_path"]
+    test_csv_path = kwargs["test_csv_path"]
+    result_file = kwargs["result_file"]
+    base, ext = os.path.splitext(result_file)
+    folder = f"{base}_{reduction}"
+    if not os.path.exists(folder):
+        os.makedirs(folder)
+    train_vector = as_float(load_vectors(csv_path))
+
+    tradeoff = {"Reduction": reduction, "Dimensions": {}}
+    for dim in [None] + list(reduction_dims):
+        run_kwargs = dict(kwargs)
+        info = {"fit_time": 0, "transform_time": 0,
+                "explained_variance": 1.0}
+        if dim is not None:
+            print(f"Reducing to {dim} dimensions with {reduction}")
+            start_time = time.time()
+            model = fit_reduction(train_vector, reduction, dim)
+            info["fit_time"] = time.time() - start_time
+            info["explained_variance"] = model["explained_variance"]
+            start_time = time.time()
+            reduced_csv_path = f"{folder}/data_{dim}.csv"
+            reduced_test_csv_path = f"{folder}/test_{dim}.csv"
+            transform_csv(csv_path, reduced_csv_path, model, chunk_size)
+            transform_csv(test_csv_path, reduced_test_csv_path, model,
+                          chunk_size, part="test")
+            info["transform_time"] = time.time() - start_time
+            run_kwargs.update(csv_path=reduced_csv_path,
+                              test_csv_path=reduced_test_csv_path,
+                              ground_truth_paths=(csv_path, test_csv_path))
+        dim = dim or train_vector.shape[1]
+        run_kwargs["result_file"] = f"{folder}/result_{dim}{ext}"
+        Benchmark(**run_kwargs)
+        with open(run_kwargs["result_file"], 'r') as f:
+            results = json.load(f)
+        info["Results"] = {
+            db_BM["Name"]: {
+                t_name: {key: method[key] for key in tradeoff_keys}
+                for t_name, method in db_BM["Methods"].items()
+            }
+            for db_BM in results
+        }
+        tradeoff["Dimensions"][str(dim)] = info
+
+    with open(result_file, 'w', encoding='utf-8') as f:
+        json.dump(tradeoff, f, ensure_ascii=False, indent=4)
     return 0
 
 
@@ -0,0 +1,54 @@
+# Spread of the per-round benchmark samples: bootstrap confidence
+# intervals and coefficient of variation
+
+import numpy as np
+
+
+def bootstrap_ci(samples, confidence=0.95, n_resamples=1000, seed=0):
+    samples = np.asarray(samples, dtype=float)
+    if samples.shape[0] < 2:
+        return float(samples.mean()), float(samples.mean())
+    rng = np.random.default_rng(seed)
+    resamples = rng.choice(samples, size=(n_resamples, samples.shape[0]),
+                           replace=True)
+    means = resamples.mean(axis=1)
+    alpha = (1 - confidence) / 2
+    low, high = np.quantile(means, [alpha, 1 - alpha])
+    return float(low), float(high)
+
+
+def summarize(samples, confidence=0.95):
+    samples = np.asarray(samples, dtype=float)
+    mean = float(samples.mean())
+    std = float(samples.std(ddof=1)) if samples.shape[0] > 1 else 0.0
+    ci_low, ci_high = bootstrap_ci(samples, confidence)
+    return {
+        "n": int(samples.shape[0]),
+        "mean": mean,
+        "std": std,
+        "cv": std / abs(mean) if mean != 0 else 0.0,
+        "ci_low": ci_low,
+        "ci_high": ci_high
+    }
+
+
+def relative_ci_width(summary):
+    if summary["mean"] == 0:
+        return 0.0
+    return (summary["ci_high"] - summary["ci_low"]) / abs(summary["mean"])
+
+
+def is_converged(rounds, keys, target):
+    # every key has a relative confidence interval width below target.
+    # Keys that less than two rounds measured (the load times when the
+    # rounds reuse a load) are left out
+    if len(rounds) < 2:
+        return False
+    for key in keys:
+        samples = [r[key] for r in rounds if key in r]
+        if len(samples) < 2:
+            continue
+        summary = summarize(samples)
+        if relative_ci_width(summary) > target:
+            return False
+    return True
@@ -6,8 +6,19 @@ import pyarrow.parquet as pq
 import pyarrow as pa
 
 
+def generate_metadata(num_vectors, num_tenants=10,
+                      selectivities=(0.5, 0.1, 0.01, 0.001)):
+    # tenants are uniform, category i matches selectivities[i] of the
+    # vectors and the last category takes the rest
+    tenants = np.random.randint(0, num_tenants, num_vectors)
+    probs = list(selectivities) + [1 - sum(selectivities)]
+    categories = np.random.choice(len(probs), size=num_vectors, p=probs)
+    return pd.DataFrame({"tenant": tenants, "category": categories})
+
+
 def generate_dataset(num_vectors, num_dimensions, folder_path,
-                     cluster=True, parquet=False):
+                     cluster=True, parquet=False, metadata=False,
+                     num_tenants=10, selectivities=(0.5, 0.1, 0.01, 0.001)):
     # if random (clustered not checked)
     num_test = int(num_vectors * 0.01)
     vectors = np.random.rand(num_vectors, num_dimensions)
@@ -50,6 +61,11 @@ def generate_dataset(num_vectors, num_dimensions, folder_path,
     our_test_df = pd.DataFrame(test_vectors)
     our_df.to_csv(f'{folder_path}/data.csv', index=False, header=True)
     our_test_df.to_csv(f'{folder_path}/test.csv', index=False, header=True)
+    if metadata:
+        metadata_df = generate_metadata(num_vectors, num_tenants,
+                                        selectivities)
+        metadata_df.to_csv(f'{folder_path}/metadata.csv', index=False,
+                           header=True)
     if parquet:
         # Create the train and test DataFrames
         train_vectors = vectors
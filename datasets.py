@@ -0,0 +1,73 @@
+# Readers for the dataset formats of the standard ANN benchmarks:
+# SIFT/GIST .fvecs/.ivecs/.bvecs and the ann-benchmarks HDF5 layout.
+# The binary formats are memory-mapped, rows are read when they are used
+
+import numpy as np
+import pandas as pd
+
+# ann-benchmarks distance names and the metric of their neighbors
+hdf5_metrics = {"euclidean": "L2", "angular": "COSINE"}
+
+
+def read_vecs(path, dtype):
+    # every row is an int32 dimension followed by dimension values
+    dim = int(np.fromfile(path, dtype=np.int32, count=1)[0])
+    value_size = np.dtype(dtype).itemsize
+    if value_size == 4:
+        data = np.memmap(path, dtype=np.int32, mode='r')
+        return data.reshape(-1, dim + 1)[:, 1:].view(dtype)
+    data = np.memmap(path, dtype=np.uint8, mode='r')
+    return data.reshape(-1, 4 + dim * value_size)[:, 4:].view(dtype)
+
+
+def read_fvecs(path):
+    return read_vecs(path, np.float32)
+
+
+def read_ivecs(path):
+    return read_vecs(path, np.int32)
+
+
+def read_bvecs(path):
+    return read_vecs(path, np.uint8)
+
+
+def read_hdf5(path, part):
+    # part is "train", "test", "neighbors" or "distances". h5py is only
+    # needed for these files. The dataset is read lazily by slices
+    import h5py
+    return h5py.File(path, 'r')[part]
+
+
+def get_hdf5_metric(path):
+    import h5py
+    with h5py.File(path, 'r') as f:
+        return hdf5_metrics.get(f.attrs.get("distance"))
+
+
+def load_vectors(path, part="train"):
+    # part picks the dataset of an HDF5 file, the other formats hold one
+    if path.endswith(".fvecs"):
+        return read_fvecs(path)
+    if path.endswith(".ivecs"):
+        return read_ivecs(path)
+    if path.endswith(".bvecs"):
+        return read_bvecs(path)
+    if path.endswith(".hdf5") or path.endswith(".h5"):
+        return read_hdf5(path, part)
+    return pd.read_csv(path).to_numpy()
+
+
+def load_neighbors(path):
+    # the shipped exact neighbours, one row of ids per test vector
+    if path.endswith(".hdf5") or path.endswith(".h5"):
+        return np.asarray(read_hdf5(path, "neighbors"), dtype=np.int64)
+    return np.asarray(read_ivecs(path), dtype=np.int64)
+
+
+def as_float(vectors):
+    # bvecs hold bytes, the engines and the ground truth need floats
+    vectors = np.asarray(vectors)
+    if not np.issubdtype(vectors.dtype, np.floating):
+        vectors = vectors.astype(np.float32)
+    return vectors
@@ -0,0 +1,85 @@
+# Reduce the dimension of the vectors before they are loaded: PCA with a
+# randomized solver or a Gaussian / sparse random projection
+
+import numpy as np
+import pandas as pd
+
+from datasets import load_vectors, as_float
+
+reduction_methods = ["pca", "gaussian", "sparse"]
+
+
+def fit_pca(train_vector, dim, n_oversamples=10, n_iter=4, seed=0):
+    # randomized SVD of the centred training vectors (Halko et al.), a few
+    # power iterations sharpen the range of the top components
+    rng = np.random.default_rng(seed)
+    mean = train_vector.mean(axis=0)
+    centred = train_vector - mean
+    rank = min(dim + n_oversamples, *centred.shape)
+    q, _ = np.linalg.qr(centred @ rng.normal(size=(centred.shape[1], rank)))
+    for _ in range(n_iter):
+        q, _ = np.linalg.qr(centred.T @ q)
+        q, _ = np.linalg.qr(centred @ q)
+    _, s, vt = np.linalg.svd(q.T @ centred, full_matrices=False)
+    return {
+        "method": "pca",
+        "mean": mean,
+        "matrix": vt[:dim].T,
+        "explained_variance": float(np.sum(s[:dim] ** 2) /
+                                    np.sum(centred ** 2))
+    }
+
+
+def fit_random_projection(train_vector, dim, sparse=False, seed=0):
+    # Gaussian entries with variance 1/dim keep the distances in
+    # expectation. The sparse one (Li et al.) has density 1/sqrt(d) and
+    # +-sqrt(1/(density*dim)) entries
+    rng = np.random.default_rng(seed)
+    d = train_vector.shape[1]
+    if sparse:
+        density = 1 / np.sqrt(d)
+        signs = rng.choice([-1.0, 0.0, 1.0], size=(d, dim),
+                           p=[density / 2, 1 - density, density / 2])
+        matrix = signs * np.sqrt(1 / (density * dim))
+    else:
+        matrix = rng.normal(0, np.sqrt(1 / dim), size=(d, dim))
+    return {
+        "method": "sparse" if sparse else "gaussian",
+        "mean": np.zeros(d),
+        "matrix": matrix,
+        "explained_variance": None
+    }
+
+
+def fit_reduction(train_vector, method, dim, seed=0):
+    if method == "pca":
+        return fit_pca(train_vector, dim, seed=seed)
+    if method in ["gaussian", "sparse"]:
+        return fit_random_projection(train_vector, dim,
+                                     sparse=method == "sparse", seed=seed)
+    raise ValueError(f"Unknown reduction {method}, use one of "
+                     f"{reduction_methods}")
+
+
+def transform(vectors, reduction):
+    return (vectors - reduction["mean"]) @ reduction["matrix"]
+
+
+def read_chunks(path, chunk_size, part="train"):
+    if path.endswith(".csv"):
+        for chunk in pd.read_csv(path, chunksize=chunk_size):
+            yield chunk.to_numpy()
+        return
+    vectors = load_vectors(path, part)
+    for start in range(0, vectors.shape[0], chunk_size):
+        yield as_float(vectors[start:start + chunk_size])
+
+
+def transform_csv(path, out_path, reduction, chunk_size=10000,
+                  part="train"):
+    # streams the vectors (csv or a format of datasets.py) in chunks, so
+    # only one chunk is in memory, and writes them to the out_path csv
+    for i, chunk in enumerate(read_chunks(path, chunk_size, part)):
+        reduced = pd.DataFrame(transform(chunk, reduction))
+        reduced.to_csv(out_path, mode='w' if i == 0 else 'a',
+                       header=i == 0, index=False)
@@ -0,0 +1,58 @@
+# Exact nearest neighbours to measure the recall of the databases
+
+import numpy as np
+from numpy.linalg import norm
+
+from datasets import as_float
+
+
+def get_ground_truth(train_vector, test_vector, metric, k=1, chunk=1000,
+                     train_chunk=20000):
+    # exact nearest neighbours of every test vector. The train vectors are
+    # read train_chunk rows at a time (they may be memory-mapped bytes) and
+    # every query keeps its k best so far, so the distance matrix never
+    # grows beyond chunk x train_chunk.
+    # the inner product metrics (IP, Dot) expect normalized vectors
+    inner_product = metric.upper() in ["COSINE", "IP", "DOT"]
+    k = min(k, train_vector.shape[0])
+    test_vector = as_float(test_vector)
+    best_dist = np.full((test_vector.shape[0], k), np.inf)
+    best_ids = np.zeros((test_vector.shape[0], k), dtype=np.int64)
+    for train_start in range(0, train_vector.shape[0], train_chunk):
+        train = as_float(train_vector[train_start:train_start + train_chunk])
+        if metric.upper() == "COSINE":
+            train = train / norm(train, axis=1, keepdims=True)
+        elif not inner_product:
+            # |a-b|^2 = |a|^2 - 2ab + |b|^2, |b|^2 is the same for every a
+            train_sq = np.sum(train ** 2, axis=1)
+        train_ids = np.arange(train_start, train_start + train.shape[0])
+        for start in range(0, test_vector.shape[0], chunk):
+            queries = test_vector[start:start + chunk]
+            if inner_product:
+                dist = -(queries @ train.T)
+            else:
+                dist = train_sq[None, :] - 2 * (queries @ train.T)
+            # the k best of the previous chunks and this one
+            dist = np.concatenate([best_dist[start:start + chunk], dist],
+                                  axis=1)
+            ids = np.concatenate([
+                best_ids[start:start + chunk],
+                np.broadcast_to(train_ids, (queries.shape[0],
+                                            train_ids.shape[0]))], axis=1)
+            nearest = np.argpartition(dist, k - 1, axis=1)[:, :k]
+            best_dist[start:start + chunk] = np.take_along_axis(
+                dist, nearest, axis=1)
+            best_ids[start:start + chunk] = np.take_along_axis(
+                ids, nearest, axis=1)
+    order = best_dist.argsort(axis=1)
+    return np.take_along_axis(best_ids, order, axis=1)
+
+
+def get_recall(result_ids, ground_truth, k=1):
+    # recall@k: share of the k exact neighbours that are in the first k
+    # results, ground_truth has one row (or one id) per query
+    ground_truth = np.asarray(ground_truth).reshape(len(result_ids), -1)[:, :k]
+    k = ground_truth.shape[1]
+    found = [np.intersect1d(ids[:k], truth).shape[0]
+             for ids, truth in zip(result_ids, ground_truth)]
+    return float(np.mean(found) / k)
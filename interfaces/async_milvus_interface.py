@@ -0,0 +1,56 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from pymilvus import Collection, connections
+
+
+class AsyncMilvusInterface:
+    # search only counterpart of MilvusInterface for asyncio clients.
+    # pymilvus 2.4 has no asyncio client, searches are sent with
+    # _async=True on one grpc channel and the executor threads only wait
+    # for the responses
+    def __init__(self, db_path, table_settings=None, concurrency=1,
+                 search_params=None):
+        self.db_path = db_path
+        self.search_params = dict(search_params or {})
+        self.alias = f"async_{id(self)}"
+        self.table_settings = table_settings or {}
+        self.collections = {}
+        self.executor = ThreadPoolExecutor(max_workers=concurrency)
+
+    async def connect_server(self):
+        connections.connect(alias=self.alias, uri=self.db_path)
+
+    async def disconnect_server(self):
+        connections.disconnect(self.alias)
+        self.collections = {}
+        self.executor.shutdown()
+
+    def _get_collection(self, name):
+        if name not in self.collections:
+            self.collections[name] = Collection(name, using=self.alias)
+        return self.collections[name]
+
+    async def similarity_search(self, name, embedding_vector, metric=None,
+                                k=1, filters=None):
+        # returns the ids and distances of the k nearest rows as arrays
+        filters = filters or {}
+        expr = " and ".join(f"{field} == {value}"
+                            for field, value in filters.items())
+        future = self._get_collection(name).search(
+            data=[embedding_vector.tolist()],
+            anns_field="vector",
+            param={"metric_type": metric, "params": self.search_params},
+            limit=k,
+            expr=expr or None,
+            _async=True
+        )
+        loop = asyncio.get_running_loop()
+        res = await loop.run_in_executor(self.executor, future.result)
+        hits = res[0]
+        ids = np.fromiter((hit.id for hit in hits), dtype=np.int64,
+                          count=len(hits))
+        distances = np.fromiter((hit.distance for hit in hits),
+                                dtype=np.float32, count=len(hits))
+        return ids, distances
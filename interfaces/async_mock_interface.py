@@ -0,0 +1,29 @@
+import asyncio
+import numpy as np
+
+
+class AsyncMockInterface:
+    # search only counterpart of MockInterface for asyncio clients
+    def __init__(self, sampler, table_settings=None):
+        self.sampler = sampler
+        self.conn = None
+        self.table_settings = table_settings or {}
+
+    async def connect_server(self):
+        self.conn = True
+
+    async def disconnect_server(self):
+        self.conn = None
+
+    async def similarity_search(self, name, embedding_vector, metric=None,
+                                k=1, filters=None):
+        # the first k ids after the injected latency, like MockInterface
+        delay = self.sampler.sample("search")
+        if delay > 0:
+            await asyncio.sleep(delay)
+        else:
+            # still yield to the event loop like a real round trip
+            await asyncio.sleep(0)
+        count = min(k, self.table_settings[name]["next_id"])
+        return np.arange(count, dtype=np.int64), np.zeros(count,
+                                                          dtype=np.float32)
@@ -0,0 +1,96 @@
+import asyncpg
+import numpy as np
+from pgvector.asyncpg import register_vector
+
+
+class AsyncPGvectorInterface:
+    # search only counterpart of PGvectorInterface for asyncio clients.
+    # A postgres connection runs one query at a time, so the pool holds
+    # one connection for every query in flight. asyncpg prepares every
+    # statement and sends the vectors in binary on its own
+    def __init__(self, dbname, user, password='', table_settings=None,
+                 concurrency=1, k=1, session_settings=None):
+        self.dbname = dbname
+        self.user = user
+        self.password = password
+        self.table_settings = table_settings or {}
+        self.concurrency = concurrency
+        self.session_settings = dict(session_settings or {})
+        # an hnsw scan returns at most ef_search rows, see
+        # PGvectorInterface._set_ef_search
+        self.ef_search = min(max(k, int(self.session_settings.get(
+            "hnsw.ef_search", 40))), 1000)
+        self.pool = None
+
+    async def _init_connection(self, conn):
+        await register_vector(conn)
+        for setting, value in self.session_settings.items():
+            await conn.execute(f"SET {setting} = {value}")
+        await conn.execute(f"SET hnsw.ef_search = {self.ef_search}")
+
+    async def connect_server(self):
+        self.pool = await asyncpg.create_pool(
+            database=self.dbname, user=self.user,
+            password=self.password or None,
+            min_size=self.concurrency, max_size=self.concurrency,
+            init=self._init_connection)
+
+    async def disconnect_server(self):
+        await self.pool.close()
+        self.pool = None
+
+    def _get_settings(self, table_name):
+        return self.table_settings.get(
+            table_name, {"dimention": None, "compression": "none",
+                         "rescore": True, "metadata_fields": []})
+
+    async def similarity_search(self, table_name, embedding_vector, metric,
+                                k=1, filters=None):
+        # returns the ids and distances of the k nearest rows as arrays
+        if metric == "l2":
+            symbol = "<->"
+        elif metric == "cosine":
+            symbol = "<=>"
+        elif metric == "ip":
+            symbol = "<#>"
+        else:
+            print("Error with metric type")
+            return
+        # filters are {field: value} pairs that all have to match, their
+        # values follow the query vector as $2, $3, ...
+        filters = filters or {}
+        where = ""
+        if len(filters) > 0:
+            where = "WHERE " + " AND ".join(
+                f"{field} = ${i + 2}" for i, field in enumerate(filters))
+        params = [embedding_vector] + list(filters.values())
+        settings = self._get_settings(table_name)
+        if settings["compression"] == "binary":
+            bits = f"bit({settings['dimention']})"
+            candidates = f"""
+            SELECT id, embedding FROM {table_name}
+            {where}
+            ORDER BY binary_quantize(embedding)::{bits} <~>
+             binary_quantize($1::vector)::{bits}
+            LIMIT {k * 10 if settings["rescore"] else k}"""
+            sim_query = f"""
+            SELECT id, embedding {symbol} $1 AS distance
+            FROM ({candidates}) AS candidates
+            ORDER BY distance ASC
+            LIMIT {k}
+            """
+        else:
+            cast = "::halfvec" if settings["compression"] == "halfvec" else ""
+            sim_query = f"""
+            SELECT id, embedding {symbol} $1::vector{cast} AS distance
+            FROM {table_name}
+            {where}
+            ORDER BY distance ASC
+            LIMIT {k}
+            """
+        result = await self.pool.fetch(sim_query, *params)
+        ids = np.fromiter((row[0] for row in result), dtype=np.int64,
+                          count=len(result))
+        distances = np.fromiter((row[1] for row in result), dtype=np.float32,
+                                count=len(result))
+        return ids, distances
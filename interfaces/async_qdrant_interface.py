@@ -0,0 +1,50 @@
+from qdrant_client import AsyncQdrantClient
+from qdrant_client.http.models import (SearchParams, QuantizationSearchParams,
+                                       Filter, FieldCondition, MatchValue)
+import numpy as np
+
+
+class AsyncQDrantInterface:
+    # search only counterpart of QDrantInterface for asyncio clients
+    def __init__(self, data_path, table_settings=None):
+        self.data_path = data_path
+        self.conn = None
+        self.table_settings = table_settings or {}
+
+    async def connect_server(self):
+        self.conn = AsyncQdrantClient(path=self.data_path)
+
+    async def disconnect_server(self):
+        await self.conn.close()
+        self.conn = None
+
+    async def similarity_search(self, collection_name, embedding_vector,
+                                metric='Cosine', k=1, filters=None):
+        # returns the ids and scores of the k nearest points as arrays
+        search_params = None
+        settings = self.table_settings.get(collection_name,
+                                           {"compression": "none"})
+        if settings["compression"] != "none":
+            search_params = SearchParams(
+                quantization=QuantizationSearchParams(
+                    rescore=settings["rescore"],
+                    oversampling=2.0 if settings["rescore"] else None))
+        # filters are {field: value} pairs that all have to match
+        query_filter = None
+        if filters:
+            query_filter = Filter(must=[
+                FieldCondition(key=field, match=MatchValue(value=value))
+                for field, value in filters.items()
+            ])
+        res = await self.conn.search(
+            collection_name=collection_name,
+            query_vector=embedding_vector.tolist(),
+            query_filter=query_filter,
+            limit=k,
+            search_params=search_params
+        )
+        ids = np.fromiter((match.id for match in res), dtype=np.int64,
+                          count=len(res))
+        scores = np.fromiter((match.score for match in res), dtype=np.float32,
+                             count=len(res))
+        return ids, scores
@@ -8,8 +8,37 @@ class QDrantInterface:
     def disconnect_server(self):
         pass
 
+    def new_connection(self):
+        # an interface that can be used from another thread
+        pass
+
+    def async_interface(self, concurrency=1, k=1):
+        # an asyncio client for the same backend with async connect_server,
+        # disconnect_server and similarity_search
+        pass
+
     def create_table(self, collection_name, vector_size, metric="",
-                     index_types=None):
+                     index_types=None, build_index=True,
+                     compression="none", rescore=True, metadata_fields=None,
+                     partition_key=None):
+        # partition_key is the metadata field that separates tenants
+        pass
+
+    def indexing_data(self, collection_name, metric, index_types):
+        pass
+
+    def wait_index_ready(self, collection_name, timeout=600):
+        pass
+
+    def get_load_key(self, metric, compression):
+        # the settings the loaded data depends on, a table loaded for one
+        # key can serve every method with the same key
+        pass
+
+    def reset_index(self, collection_name, metric, compression,
+                    rescore=True):
+        # drops the vector index of a loaded table and switches it to
+        # metric and compression, indexing_data builds the new index
         pass
 
     def drop_table(self, collection_name):
@@ -18,18 +47,43 @@ class QDrantInterface:
     def get_size_of_table(self, collection_name):
         pass
 
-    def insert_single_vector(self, collection_name, vector):
+    def get_total_size(self, collection_names):
+        # bytes on disk of all the tables together, None when the backend
+        # can not attribute its storage to tables
         pass
 
-    def transfer_csv(self, csv_path):
+    def get_size_breakdown(self, collection_name):
+        # total_bytes, vector_bytes, index_bytes, meta_bytes and
+        # bytes_per_vector. A part the backend can not measure is None and
+        # a "note" says why
+        pass
+
+    def insert_single_vector(self, collection_name, vector, id):
+        # inserts or replaces the row with this id
+        pass
+
+    def transfer_vectors(self, vectors, start_id=0, metadata=None,
+                         ids=None):
+        pass
+
+    def transfer_csv(self, csv_path, metadata_path=None, normalize=False):
         pass
 
     def insert_vector_from_csv(self, collection_name, points):
         pass
 
+    def update_vectors(self, collection_name, points):
+        pass
+
+    def delete_vectors(self, collection_name, ids):
+        pass
+
+    def compact_table(self, collection_name, full=False):
+        pass
+
     def get_rows_cnt(self, collection_name):
         pass
 
     def similarity_search(self, collection_name, embedding_vector,
-                          metric='Cosine', limit=5):
+                          metric='Cosine', k=1, filters=None):
         pass
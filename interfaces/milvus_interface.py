@@ -1,15 +1,24 @@
 # pip install pymilvus milvus sentence-transformers
-# import numpy as np
+import numpy as np
+import os
+import time
 import pandas as pd
 # from milvus import default_server
-from pymilvus import MilvusClient, DataType
+from pymilvus import MilvusClient, DataType, Collection, utility
+from pymilvus.grpc_gen import common_pb2
 # from time import time
 
 
 class MilvusInterface:
-    def __init__(self, db_path):
+    def __init__(self, db_path, nlist=128, search_params=None):
+        # nlist is the number of IVF clusters, search_params are sent with
+        # every search, e.g. {"nprobe": 16} for IVF or {"ef": 64} for HNSW
         self.db_path = db_path
+        self.nlist = nlist
+        self.search_params = dict(search_params or {})
         self.conn = None
+        self.index_size = {}
+        self.table_settings = {}
         self.connect_server()
         pass
 
@@ -20,7 +29,31 @@ class MilvusInterface:
         self.client.close()
         pass
 
-    def create_table(self, name, dimention, metric=None, index_types=None):
+    def new_connection(self):
+        # the grpc client is thread safe, threads can share it
+        return self
+
+    def async_interface(self, concurrency=1, k=1):
+        from interfaces.async_milvus_interface import AsyncMilvusInterface
+        return AsyncMilvusInterface(self.db_path, self.table_settings,
+                                    concurrency, self.search_params)
+
+    def create_table(self, name, dimention, metric=None, index_types=None,
+                     build_index=True, compression="none", rescore=True,
+                     metadata_fields=None, partition_key=None):
+        # compression "sq8" and "pq" replace the index with IVF_SQ8 and
+        # IVF_PQ, Milvus has no re-ranking for them so rescore is unused.
+        # partition_key hashes the rows of every value of that field into
+        # their own partitions, Milvus Lite has no partition keys
+        if compression not in ["none", "sq8", "pq"]:
+            print(f"Unknown compression {compression}, using none")
+            compression = "none"
+        metadata_fields = list(metadata_fields or [])
+        self.table_settings[name] = {
+            "dimention": dimention,
+            "compression": compression,
+            "metadata_fields": metadata_fields
+        }
         if self.client.has_collection(name):
             res = self.client.describe_collection(
                 collection_name=name
@@ -39,6 +72,11 @@ class MilvusInterface:
             schema.add_field(field_name="vector",
                              datatype=DataType.FLOAT_VECTOR,
                              dim=dimention)
+            for field in metadata_fields:
+                schema.add_field(
+                    field_name=field, datatype=DataType.INT64,
+                    is_partition_key=(field == partition_key and
+                                      not self.db_path.endswith(".db")))
 
             # 3. Create collection
             self.client.create_collection(
@@ -46,66 +84,216 @@ class MilvusInterface:
                 schema=schema,
                 metric_type=metric
             )
-            index_params = self.client.prepare_index_params()
-            index_params.add_index(
-                field_name="vector",
-                metric_type=metric,
-                index_type=index_types,
-                index_name="vector_index",
-                params={"nlist": 128}
-            )
-
-            self.client.create_index(
-                collection_name=name,
-                index_params=index_params
-            )
+            # Milvus Lite has no scalar indexes, filters scan the field
+            if len(metadata_fields) > 0 and not self.db_path.endswith(".db"):
+                index_params = self.client.prepare_index_params()
+                for field in metadata_fields:
+                    index_params.add_index(field_name=field,
+                                           index_type="STL_SORT",
+                                           index_name=f"{field}_index")
+                self.client.create_index(collection_name=name,
+                                         index_params=index_params)
+            if build_index:
+                self.indexing_data(name, metric, index_types)
         pass
 
+    def _get_index_params(self, name, index_type):
+        settings = self.table_settings.get(
+            name, {"dimention": None, "compression": "none"})
+        params = {"nlist": self.nlist}
+        if settings["compression"] == "sq8":
+            index_type = "IVF_SQ8"
+        elif settings["compression"] == "pq":
+            index_type = "IVF_PQ"
+            # the number of sub-quantizers has to divide the dimention
+            dim = settings["dimention"]
+            m = 64
+            while dim % m != 0:
+                m -= 1
+            params.update({"m": m, "nbits": 8})
+        return index_type, params
+
     def indexing_data(self, name, metric, index_type):
+        size_before = self._get_path_size()
+        index_type, params = self._get_index_params(name, index_type)
         index_params = self.client.prepare_index_params()
         index_params.add_index(
             field_name="vector",
             metric_type=metric,
             index_type=index_type,
-            index_name="vector_index"
+            index_name="vector_index",
+            params=params
         )
         self.client.create_index(
             collection_name=name,
             index_params=index_params
         )
+        self.index_size[name] = max(self._get_path_size() - size_before, 0)
+
+    def get_load_key(self, metric, compression):
+        # the metric and the compression are parameters of the index
+        return ()
+
+    def reset_index(self, name, metric, compression, rescore=True):
+        # drops the vector index of a loaded collection so that another
+        # one can be built on the same rows, see get_load_key
+        self.client.release_collection(collection_name=name)
+        self.client.drop_index(collection_name=name, index_name="vector_index")
+        self.index_size.pop(name, None)
+        self.table_settings[name]["compression"] = compression
+
+    def wait_index_ready(self, name, timeout=600):
+        # upserted rows stay in growing segments, which are searched
+        # without the index, until a flush seals them. Index building is
+        # asynchronous, poll until no rows are pending, then load the
+        # collection so that the searches use the new index
+        self.flush_table(name)
+        start_time = time.time()
+        while time.time() - start_time < timeout:
+            res = self.client.describe_index(
+                collection_name=name,
+                index_name="vector_index"
+            )
+            if not res or res.get("pending_index_rows", 0) == 0:
+                self.load_table(name)
+                return True
+            time.sleep(0.1)
+        return False
+
+    def _get_collection(self, name):
+        # the orm collection on the same connection, for the calls
+        # MilvusClient does not have
+        return Collection(name, using=self.client._using)
+
+    def flush_table(self, name):
+        # seals the growing segments, sealed segments get indexed
+        self._get_collection(name).flush()
+
+    def load_table(self, name):
+        self.client.load_collection(collection_name=name)
+
+    def release_table(self, name):
+        self.client.release_collection(collection_name=name)
+
+    def get_segment_states(self, name):
+        # loaded rows per segment state ("Sealed", "Growing") and the
+        # number of loaded segments, None where Milvus Lite can not tell
+        if self.db_path.endswith(".db"):
+            return None
+        states = {"segments": 0}
+        for segment in utility.get_query_segment_info(
+                name, using=self.client._using):
+            state = common_pb2.SegmentState.Name(segment.state)
+            states[state] = states.get(state, 0) + segment.num_rows
+            states["segments"] += 1
+        return states
 
     def drop_table(self, name):
         self.client.drop_collection(
             collection_name=name
         )
+        self.index_size.pop(name, None)
+        self.table_settings.pop(name, None)
         pass
 
+    def _get_path_size(self):
+        # Milvus Lite keeps everything in the local db file (or directory)
+        # and hidden companion files next to it
+        folder = os.path.dirname(os.path.abspath(self.db_path))
+        base = os.path.basename(self.db_path)
+        total_size = 0
+        if not os.path.exists(folder):
+            return 0
+        for entry in os.listdir(folder):
+            if entry != base and not entry.startswith(f".{base}"):
+                continue
+            path = os.path.join(folder, entry)
+            if os.path.isfile(path):
+                total_size += os.path.getsize(path)
+                continue
+            for dirpath, dirnames, filenames in os.walk(path):
+                for f in filenames:
+                    fp = os.path.join(dirpath, f)
+                    if os.path.isfile(fp):
+                        total_size += os.path.getsize(fp)
+        return total_size
+
     def get_size_of_table(self, name):
-        # query = f"""SELECT
-        #  pg_size_pretty( pg_total_relation_size('{table_name}'))"""
-        # result = self.conn.execute(query).fetchall()
-        # self.conn.commit()
-        # print(result)
-        # return result[0][0]
-        return 0
-        pass
+        # Milvus Lite shares one db between all collections, the
+        # benchmark only keeps one collection at a time
+        return self._get_path_size()
 
-    def insert_single_vector(self, table_name, vector):
-        # query = f'INSERT INTO {table_name} (embedding) VALUES (%s)'
-        # self.conn.execute(query, (vector,))
-        # self.conn.commit()
-        pass
+    def get_total_size(self, names):
+        # the Milvus Lite file holds every collection and does not shrink
+        # when one is dropped, it can not be split between collections
+        if self.db_path.endswith(".db"):
+            return None
+        return self._get_path_size()
 
-    def transfer_csv(self, csv_path):
-        df = pd.read_csv(csv_path)
-        df = df.to_numpy()
-        # print(f"{df.shape = }")
+    def get_size_breakdown(self, name):
+        total = self.get_size_of_table(name)
+        rows = self.get_rows_cnt(name)
+        if self.db_path.endswith(".db"):
+            # Milvus Lite keeps its indexes in memory and the file does not
+            # change when one is built, only the total can be measured
+            return {
+                "total_bytes": total,
+                "vector_bytes": None,
+                "index_bytes": None,
+                "meta_bytes": None,
+                "bytes_per_vector": total / rows if rows > 0 else 0,
+                "note": "Milvus Lite keeps indexes in memory, only the "
+                        "db file size is measured"
+            }
+        res = self.client.describe_collection(collection_name=name)
+        dim = 0
+        for field in res["fields"]:
+            if field["name"] == "vector":
+                dim = field["params"]["dim"]
+        vector = rows * int(dim) * 4
+        index = self.index_size.get(name, 0)
+        return {
+            "total_bytes": total,
+            "vector_bytes": vector,
+            "index_bytes": index,
+            "meta_bytes": max(total - vector - index, 0),
+            "bytes_per_vector": total / rows if rows > 0 else 0
+        }
+
+    def insert_single_vector(self, table_name, vector, id):
+        # upsert, so an id that is already taken replaces its row instead
+        # of adding a second row with the same primary key
+        self.client.upsert(
+            collection_name=table_name,
+            data=[{"id": int(id), "vector": vector}]
+        )
+
+    def transfer_vectors(self, vectors, start_id=0, metadata=None,
+                         ids=None):
+        if ids is None:
+            ids = range(start_id, start_id + vectors.shape[0])
+        ids = [int(id) for id in ids]
         data = [
-            {"id": i, "vector": df[i, :]}
-            for i in range(df.shape[1])
+            {"id": ids[i], "vector": vectors[i, :]}
+            for i in range(vectors.shape[0])
         ]
+        if metadata is not None:
+            for i in range(len(data)):
+                data[i].update(metadata[i])
         return data
 
+    def transfer_csv(self, csv_path, metadata_path=None, normalize=False):
+        df = pd.read_csv(csv_path)
+        df = df.to_numpy()
+        if normalize:
+            # unit vectors, so the inner product (IP) is the cosine
+            df = df / np.linalg.norm(df, axis=1, keepdims=True)
+        # print(f"{df.shape = }")
+        metadata = None
+        if metadata_path is not None:
+            metadata = pd.read_csv(metadata_path).to_dict("records")
+        return self.transfer_vectors(df, metadata=metadata)
+
     def insert_vector_from_csv(self, name, data):
         r = self.client.upsert(
             collection_name=name,
@@ -119,6 +307,31 @@ class MilvusInterface:
         # print(res)
         pass
 
+    def update_vectors(self, name, data):
+        # upsert replaces the rows with the same ids
+        self.client.upsert(
+            collection_name=name,
+            data=data
+        )
+
+    def delete_vectors(self, name, ids):
+        self.client.delete(
+            collection_name=name,
+            ids=[int(id) for id in ids]
+        )
+
+    def compact_table(self, name, full=False, timeout=600):
+        # merges small segments and drops deleted rows, waits until done.
+        # MilvusClient has no compact here, use the orm collection on the
+        # same connection
+        if self.db_path.endswith(".db"):
+            print("Milvus Lite does not support compaction")
+            return False
+        collection = self._get_collection(name)
+        collection.compact()
+        collection.wait_for_compaction_completed(timeout=timeout)
+        return True
+
     def get_rows_cnt(self, name):
         res = self.client.get_collection_stats(
             collection_name=name
@@ -126,16 +339,29 @@ class MilvusInterface:
         return res['row_count']
         pass
 
-    def similarity_search(self, name, embedding_vector, metric=None):
+    def similarity_search(self, name, embedding_vector, metric=None, k=1,
+                          filters=None):
+        # returns the ids and distances of the k nearest rows as arrays
+        # filters are {field: value} pairs that all have to match
+        filters = filters or {}
+        expr = " and ".join(f"{field} == {value}"
+                            for field, value in filters.items())
         res = self.client.search(
             collection_name=name,
             data=[embedding_vector.tolist()],
-            limit=3,
-            search_params={"metric_type": metric, "params": {}}
+            filter=expr,
+            limit=k,
+            search_params={"metric_type": metric,
+                           "params": self.search_params}
         )
         # print(res[0])
         # print(type(res))
         # result = json.dumps(res, indent=4)
         # print(result)
         # print(result)
-        return res[0][0]['id'], res[0][0]['distance']
+        hits = res[0]
+        ids = np.fromiter((hit['id'] for hit in hits), dtype=np.int64,
+                          count=len(hits))
+        distances = np.fromiter((hit['distance'] for hit in hits),
+                                dtype=np.float32, count=len(hits))
+        return ids, distances
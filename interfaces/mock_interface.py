@@ -0,0 +1,161 @@
+# A backend that keeps no data and answers after an injected latency, for
+# the throughput ceiling of the harness itself and for running the
+# benchmark without a database
+import threading
+import time
+import numpy as np
+import pandas as pd
+
+latency_distributions = ["constant", "exponential", "lognormal"]
+
+
+class LatencySampler:
+    def __init__(self, latency=None, distribution="constant", sigma=0.5,
+                 seed=0):
+        # latency is the mean delay in seconds of every operation,
+        # {"search": 0.001, "insert": 0.01}, the others answer instantly.
+        # lognormal keeps the mean with sigma as the spread
+        if distribution not in latency_distributions:
+            raise ValueError(f"Unknown distribution {distribution}, use one "
+                             f"of {latency_distributions}")
+        self.latency = dict(latency or {})
+        self.distribution = distribution
+        self.sigma = sigma
+        self.rng = np.random.default_rng(seed)
+        self.lock = threading.Lock()
+
+    def sample(self, operation):
+        mean = self.latency.get(operation, 0)
+        if mean <= 0:
+            return 0
+        if self.distribution == "constant":
+            return mean
+        with self.lock:
+            if self.distribution == "exponential":
+                return float(self.rng.exponential(mean))
+            return float(self.rng.lognormal(
+                np.log(mean) - self.sigma ** 2 / 2, self.sigma))
+
+    def wait(self, operation):
+        delay = self.sample(operation)
+        if delay > 0:
+            time.sleep(delay)
+
+
+class MockInterface:
+    def __init__(self, latency=None, distribution="constant", sigma=0.5,
+                 seed=0):
+        self.sampler = LatencySampler(latency, distribution, sigma, seed)
+        self.conn = None
+        # number of rows and settings of every table, no vectors are kept
+        self.table_settings = {}
+        self.lock = threading.Lock()
+        self.connect_server()
+        pass
+
+    def connect_server(self):
+        self.sampler.wait("connect")
+        self.conn = True
+
+    def disconnect_server(self):
+        self.conn = None
+
+    def new_connection(self):
+        # no client state, threads share this one
+        return self
+
+    def async_interface(self, concurrency=1, k=1):
+        from interfaces.async_mock_interface import AsyncMockInterface
+        return AsyncMockInterface(self.sampler, self.table_settings)
+
+    def create_table(self, name, dimention, metric=None, index_types=None,
+                     build_index=True, compression="none", rescore=True,
+                     metadata_fields=None, partition_key=None):
+        self.sampler.wait("create")
+        self.table_settings[name] = {
+            "dimention": dimention,
+            "compression": compression,
+            "rows": 0,
+            "next_id": 0
+        }
+        if build_index:
+            self.indexing_data(name, metric, index_types)
+
+    def indexing_data(self, name, metric, index_types):
+        self.sampler.wait("index")
+
+    def wait_index_ready(self, name, timeout=600):
+        return True
+
+    def get_load_key(self, metric, compression):
+        return ()
+
+    def reset_index(self, name, metric, compression, rescore=True):
+        self.table_settings[name]["compression"] = compression
+
+    def drop_table(self, name):
+        self.table_settings.pop(name, None)
+
+    def get_size_of_table(self, name):
+        return 0
+
+    def get_total_size(self, names):
+        return 0
+
+    def get_size_breakdown(self, name):
+        return {
+            "total_bytes": 0,
+            "vector_bytes": 0,
+            "index_bytes": 0,
+            "meta_bytes": 0,
+            "bytes_per_vector": 0
+        }
+
+    def _add_rows(self, name, ids):
+        with self.lock:
+            settings = self.table_settings[name]
+            settings["rows"] += len(ids)
+            if len(ids) > 0:
+                settings["next_id"] = max(settings["next_id"],
+                                          int(max(ids)) + 1)
+
+    def insert_single_vector(self, name, vector, id):
+        self.sampler.wait("insert")
+        self._add_rows(name, [id])
+
+    def transfer_vectors(self, vectors, start_id=0, metadata=None,
+                         ids=None):
+        # only the ids are kept
+        if ids is None:
+            ids = range(start_id, start_id + vectors.shape[0])
+        return [int(id) for id in ids]
+
+    def transfer_csv(self, csv_path, metadata_path=None, normalize=False):
+        return self.transfer_vectors(pd.read_csv(csv_path).to_numpy())
+
+    def insert_vector_from_csv(self, name, data):
+        self.sampler.wait("insert")
+        self._add_rows(name, data)
+
+    def update_vectors(self, name, data):
+        self.sampler.wait("update")
+
+    def delete_vectors(self, name, ids):
+        self.sampler.wait("delete")
+        with self.lock:
+            self.table_settings[name]["rows"] -= len(ids)
+
+    def compact_table(self, name, full=False):
+        self.sampler.wait("compact")
+        return True
+
+    def get_rows_cnt(self, name):
+        return self.table_settings[name]["rows"]
+
+    def similarity_search(self, name, embedding_vector, metric=None, k=1,
+                          filters=None):
+        # the first k ids, the recall is not meaningful
+        self.sampler.wait("search")
+        count = min(k, self.table_settings[name]["next_id"])
+        return np.arange(count, dtype=np.int64), np.zeros(count,
+                                                          dtype=np.float32)
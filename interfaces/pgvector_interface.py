@@ -7,11 +7,19 @@ from pgvector.psycopg2 import register_vector
 
 
 class PGvectorInterface:
-    def __init__(self, dbname, user, password=''):
+    def __init__(self, dbname, user, password='', prepared=True,
+                 session_settings=None):
+        # prepared keeps one server side prepared kNN statement per table,
+        # metric and k. session_settings are SET once per connection, e.g.
+        # {"hnsw.ef_search": 100, "ivfflat.probes": 10, "jit": "off"}
         self.dbname = dbname
         self.user = user
         self.password = password
+        self.prepared = prepared
+        self.session_settings = dict(session_settings or {})
         self.conn = None
+        # dimention and compression of every created table
+        self.table_settings = {}
         self.connect_server()
         pass
 
@@ -20,53 +28,82 @@ class PGvectorInterface:
             f"dbname={self.dbname} user={self.user} password={self.password}"
         )
         self.cur = self.conn.cursor()
+        # prepared statements and settings only live as long as the session
+        self.statements = {}
+        self.statement_count = 0
+        for setting, value in self.session_settings.items():
+            self.cur.execute(f"SET {setting} = {value}")
+        # hnsw.ef_search of this session, see _set_ef_search
+        self.ef_search = int(self.session_settings.get("hnsw.ef_search", 40))
         self.cur.execute('CREATE EXTENSION IF NOT EXISTS vector')
+        self.conn.commit()
         register_vector(self.conn)
 
     def disconnect_server(self):
         self.conn.close()
 
+    def new_connection(self):
+        # an extra connection for another thread, sharing the table settings
+        db = PGvectorInterface(self.dbname, self.user, self.password,
+                               self.prepared, self.session_settings)
+        db.table_settings = self.table_settings
+        return db
+
+    def async_interface(self, concurrency=1, k=1):
+        # asyncio client for the same database, asyncpg is only needed here
+        from interfaces.async_pgvector_interface import AsyncPGvectorInterface
+        return AsyncPGvectorInterface(self.dbname, self.user, self.password,
+                                      self.table_settings, concurrency, k,
+                                      self.session_settings)
+
     def execute_query(self, query):
         result = self.conn.execute(query).fetchall()
         return result
 
     def create_table(self, table_name, dimention,
-                     metric=None, index_types=None):
+                     metric=None, index_types=None, build_index=True,
+                     compression="none", rescore=True, metadata_fields=None,
+                     partition_key=None):
+        # compression "halfvec" stores half precision vectors, "binary"
+        # indexes the binary quantized vectors and (with rescore) re-ranks
+        # the candidates with the full vectors. Every metadata column has
+        # a btree index, which also serves the partition_key filters
+        if compression not in ["none", "halfvec", "binary"]:
+            print(f"Unknown compression {compression}, using none")
+            compression = "none"
+        metadata_fields = list(metadata_fields or [])
+        self.table_settings[table_name] = {
+            "dimention": dimention,
+            "compression": compression,
+            "rescore": rescore,
+            "metadata_fields": metadata_fields
+        }
+        column_type = "halfvec" if compression == "halfvec" else "vector"
+        metadata_columns = "".join(f", {field} bigint"
+                                   for field in metadata_fields)
         query = f'''CREATE TABLE IF NOT EXISTS {table_name}
-         (id bigserial PRIMARY KEY, embedding vector({dimention}))'''
+         (id bigserial PRIMARY KEY, embedding {column_type}({dimention})
+         {metadata_columns})'''
         self.cur.execute(query)
-        index_flag = 0
-        if index_types == "hnsw":
-            index_flag = 1
-            pass
-        elif index_types == "ivfflat":
-            index_flag = 1
-            pass
-        else:
-            index_flag = 0
-            print("No index_types")
-
-        if metric == 'l2':
-            index_flag = 1
-            metric_name = "vector_l2_ops"
-        elif metric == 'cosine':
-            index_flag = 1
-            metric_name = "vector_cosine_ops"
-        else:
-            print("No metric")
-
-        if index_flag == 1:
-            index_query = f"""
-            CREATE INDEX ON {table_name}
-            USING {index_types} (embedding {metric_name})"""
-            self.cur.execute(index_query)
-            # print("create index")
-        else:
-            print("no indexing")
+        for field in metadata_fields:
+            self.cur.execute(f"CREATE INDEX ON {table_name} ({field})")
+        # commit so that other connections see the table
+        self.conn.commit()
+        if not build_index:
+            # the index is built later with indexing_data
+            return
+        if index_types not in ["hnsw", "ivfflat"]:
+            print("No index_types, no indexing")
+            return
+        self.indexing_data(table_name, metric, index_types)
 
     def drop_table(self, table_name):
+        for key in [key for key in self.statements if key[0] == table_name]:
+            self.cur.execute(f"DEALLOCATE {self.statements.pop(key)}")
         query = "DROP TABLE IF EXISTS " + table_name
         self.cur.execute(query)
+        self.conn.commit()
+        self.table_settings.pop(table_name, None)
 
     def get_size_of_table(self, table_name):
         query = f"""SELECT
@@ -77,33 +114,158 @@ class PGvectorInterface:
         # print(result)
         return result[0][0]
 
-    def insert_single_vector(self, table_name, vector):
-        query = f'INSERT INTO {table_name} (embedding) VALUES (%s)'
-        self.cur.execute(query, (vector,))
+    def get_total_size(self, table_names):
+        total = 0
+        for table_name in table_names:
+            self.cur.execute(
+                f"SELECT pg_total_relation_size('{table_name}')")
+            total += self.cur.fetchall()[0][0]
+        return total
+
+    def get_size_breakdown(self, table_name):
+        query = f"""SELECT
+         pg_total_relation_size('{table_name}'), pg_table_size('{table_name}'),
+         pg_indexes_size('{table_name}'),
+         (SELECT COUNT(*) FROM {table_name}),
+         (SELECT COALESCE(SUM(pg_column_size(embedding)), 0)
+          FROM {table_name})"""
+        self.cur.execute(query)
+        total, table, index, rows, vector = self.cur.fetchall()[0]
+        # heap tuple headers, ids, toast, free space and visibility maps
+        meta = table - vector
+        return {
+            "total_bytes": total,
+            "vector_bytes": vector,
+            "index_bytes": index,
+            "meta_bytes": meta,
+            "bytes_per_vector": total / rows if rows > 0 else 0
+        }
+
+    def insert_single_vector(self, table_name, vector, id):
+        # the ids are always given, the bigserial sequence never advances
+        # and would collide with them
+        query = f"""INSERT INTO {table_name} (id, embedding) VALUES (%s, %s)
+        ON CONFLICT (id) DO UPDATE SET embedding = EXCLUDED.embedding"""
+        self.cur.execute(query, (int(id), vector))
         self.conn.commit()
 
-    def transfer_csv(self, csv_path):
+    def transfer_vectors(self, vectors, start_id=0, metadata=None,
+                         ids=None):
+        if ids is None:
+            ids = range(start_id, start_id + vectors.shape[0])
+        ids = [int(id) for id in ids]
+        if metadata is not None:
+            # metadata columns follow the vector in every row
+            return [(ids[i], np.array(vectors[i, :]),
+                     *metadata[i].values())
+                    for i in range(vectors.shape[0])]
+        data = [(ids[i], np.array(vectors[i, :]))
+                for i in range(vectors.shape[0])]
+        return data
+
+    def transfer_csv(self, csv_path, metadata_path=None, normalize=False):
         df = pd.read_csv(csv_path)
         data = df.to_numpy()
-        data = [(i, np.array(data[i, :])) for i in range(data.shape[0])]
-        return data
+        if normalize:
+            # unit vectors, so the inner product (ip) is the cosine
+            data = data / np.linalg.norm(data, axis=1, keepdims=True)
+        metadata = None
+        if metadata_path is not None:
+            metadata = pd.read_csv(metadata_path).to_dict("records")
+        return self.transfer_vectors(data, metadata=metadata)
 
     def insert_vector_from_csv(self, table_name, data):
+        settings = self._get_settings(table_name)
+        columns = ", ".join(["id", "embedding"] +
+                            settings["metadata_fields"])
+        query = f'INSERT INTO {table_name} ({columns}) VALUES %s'
+        execute_values(self.cur, query, data)
+        self.conn.commit()
 
-        query = f'INSERT INTO {table_name} (id, embedding) VALUES %s'
+    def update_vectors(self, table_name, data):
+        # data from transfer_vectors, rows are replaced by id
+        settings = self._get_settings(table_name)
+        fields = ["embedding"] + settings["metadata_fields"]
+        columns = ", ".join(["id"] + fields)
+        updates = ", ".join(f"{field} = EXCLUDED.{field}" for field in fields)
+        query = f"""INSERT INTO {table_name} ({columns}) VALUES %s
+        ON CONFLICT (id) DO UPDATE SET {updates}"""
         execute_values(self.cur, query, data)
+        self.conn.commit()
+
+    def delete_vectors(self, table_name, ids):
+        query = f'DELETE FROM {table_name} WHERE id = ANY(%s)'
+        self.cur.execute(query, ([int(id) for id in ids],))
+        self.conn.commit()
+
+    def compact_table(self, table_name, full=False):
+        # VACUUM can not run inside a transaction block. FULL rewrites the
+        # table and its indexes and gives the space back to the system.
+        # autocommit can only be switched outside a transaction, and every
+        # query since the last commit (e.g. the searches) opened one
+        self.conn.commit()
+        autocommit = self.conn.autocommit
+        self.conn.autocommit = True
+        try:
+            self.cur.execute(f"VACUUM {'FULL ' if full else ''}{table_name}")
+        finally:
+            self.conn.autocommit = autocommit
+        return True
+
+    def _set_ef_search(self, k):
+        # an hnsw scan returns at most ef_search rows (40 by default), raise
+        # it once when a larger k is asked for. pgvector caps it at 1000
+        ef_search = min(max(k, int(self.session_settings.get(
+            "hnsw.ef_search", 40))), 1000)
+        if ef_search != self.ef_search:
+            self.cur.execute(f"SET hnsw.ef_search = {ef_search}")
+            self.ef_search = ef_search
+
+    def _get_settings(self, table_name):
+        return self.table_settings.get(
+            table_name, {"dimention": None, "compression": "none",
+                         "rescore": True, "metadata_fields": []})
 
     def indexing_data(self, table_name, metric, index_types):
-        if metric == 'l2':
-            metric_name = "vector_l2_ops"
-        elif metric == 'cosine':
-            metric_name = "vector_cosine_ops"
-        else:
+        settings = self._get_settings(table_name)
+        if metric not in ['l2', 'cosine', 'ip']:
+            print("No metric")
             return
+        if settings["compression"] == "binary":
+            # the hamming distance of the sign bits approximates both metrics
+            bits = f"bit({settings['dimention']})"
+            column = f"(binary_quantize(embedding)::{bits})"
+            metric_name = "bit_hamming_ops"
+        elif settings["compression"] == "halfvec":
+            column = "embedding"
+            metric_name = f"halfvec_{metric}_ops"
+        else:
+            column = "embedding"
+            metric_name = f"vector_{metric}_ops"
         index_query = f"""
-        CREATE INDEX ON {table_name}
-        USING {index_types} (embedding {metric_name})"""
+        CREATE INDEX {table_name}_embedding_index ON {table_name}
+        USING {index_types} ({column} {metric_name})"""
         self.cur.execute(index_query)
+        self.conn.commit()
+
+    def get_load_key(self, metric, compression):
+        # the loaded rows only depend on the column type, the metric and
+        # binary quantization live in the index
+        return ("halfvec" if compression == "halfvec" else "vector",)
+
+    def reset_index(self, table_name, metric, compression, rescore=True):
+        # drops the vector index of a loaded table so that another one can
+        # be built on the same rows, see get_load_key
+        for key in [key for key in self.statements if key[0] == table_name]:
+            self.cur.execute(f"DEALLOCATE {self.statements.pop(key)}")
+        self.cur.execute(f"DROP INDEX IF EXISTS {table_name}_embedding_index")
+        self.conn.commit()
+        self.table_settings[table_name].update(compression=compression,
+                                               rescore=rescore)
+
+    def wait_index_ready(self, table_name, timeout=600):
+        # CREATE INDEX only returns once the index is built
+        return True
 
     def get_rows_cnt(self, table_name):
         query = f'SELECT COUNT(*) FROM {table_name}'
@@ -111,21 +273,102 @@ class PGvectorInterface:
         result = self.cur.fetchall()
         return result[0][0]
 
-    def similarity_search(self, table_name, embedding_vector, metric):
+    def _get_search_query(self, table_name, metric, k, filters, vector,
+                          values):
+        # vector and values are the placeholders of the query vector and
+        # the filter values, "%s" for psycopg2 or $1, $2, ... for PREPARE
         if metric == "l2":
             symbol = "<->"
         elif metric == "cosine":
             symbol = "<=>"
+        elif metric == "ip":
+            # the negative inner product, smaller is closer
+            symbol = "<#>"
         else:
+            raise ValueError(f"Error with metric type {metric}")
+        # filters are {field: value} pairs that all have to match
+        where = ""
+        if len(filters) > 0:
+            where = "WHERE " + " AND ".join(
+                f"{field} = {value}" for field, value in zip(filters, values))
+        settings = self._get_settings(table_name)
+        if settings["compression"] == "binary":
+            bits = f"bit({settings['dimention']})"
+            candidates = f"""
+            SELECT id, embedding FROM {table_name}
+            {where}
+            ORDER BY binary_quantize(embedding)::{bits} <~>
+             binary_quantize({vector}::vector)::{bits}
+            LIMIT {k * 10 if settings["rescore"] else k}"""
+            return f"""
+            SELECT id, embedding {symbol} ({vector}) AS distance
+            FROM ({candidates}) AS candidates
+            ORDER BY distance ASC
+            LIMIT {k}
+            """
+        cast = "::halfvec" if settings["compression"] == "halfvec" else ""
+        return f"""
+            SELECT id, embedding {symbol} ({vector}){cast} AS distance
+            FROM {table_name}
+            {where}
+            ORDER BY distance ASC
+            LIMIT {k}
+            """
+
+    def _get_search_statement(self, table_name, embedding_vector, metric, k,
+                              filters):
+        # returns the query and its parameters, either EXECUTE of the
+        # prepared statement or the full query
+        filter_params = tuple(filters.values())
+        if self.prepared:
+            key = (table_name, metric, k, tuple(filters))
+            if key not in self.statements:
+                name = f"knn_{self.statement_count}"
+                self.statement_count += 1
+                types = ", ".join(["vector"] + ["bigint"] * len(filters))
+                query = self._get_search_query(
+                    table_name, metric, k, filters, "$1",
+                    [f"${i + 2}" for i in range(len(filters))])
+                self.cur.execute(f"PREPARE {name} ({types}) AS {query}")
+                self.statements[key] = name
+            placeholders = ", ".join(["%s"] * (len(filters) + 1))
+            return (f"EXECUTE {self.statements[key]} ({placeholders})",
+                    (embedding_vector,) + filter_params)
+        query = self._get_search_query(table_name, metric, k, filters, "%s",
+                                       ["%s"] * len(filters))
+        if self._get_settings(table_name)["compression"] == "binary":
+            return query, ((embedding_vector,) + filter_params +
+                           (embedding_vector,))
+        return query, (embedding_vector,) + filter_params
+
+    def similarity_search(self, table_name, embedding_vector, metric, k=1,
+                          filters=None):
+        # returns the ids and distances of the k nearest rows as arrays
+        if metric not in ["l2", "cosine", "ip"]:
             print("Error with metric type")
             return
-        sim_query = f"""
-        SELECT id, embedding {symbol} (%s) AS distance
-        FROM {table_name}
-        ORDER BY distance ASC
-        LIMIT 3
-        """
-        self.cur.execute(sim_query, (embedding_vector,))
+        filters = filters or {}
+        settings = self._get_settings(table_name)
+        self._set_ef_search(k * 10 if settings["compression"] == "binary"
+                            and settings["rescore"] else k)
+        query, params = self._get_search_statement(
+            table_name, embedding_vector, metric, k, filters)
+        self.cur.execute(query, params)
         result = self.cur.fetchall()
         # print(result)
-        return result[0][0], result[0][1]
+        ids = np.fromiter((row[0] for row in result), dtype=np.int64,
+                          count=len(result))
+        distances = np.fromiter((row[1] for row in result), dtype=np.float32,
+                                count=len(result))
+        return ids, distances
+
+    def explain_search(self, table_name, embedding_vector, metric, k=1,
+                       filters=None):
+        # planning and execution time in seconds as reported by the server
+        # for the same statement similarity_search runs
+        filters = filters or {}
+        query, params = self._get_search_statement(
+            table_name, embedding_vector, metric, k, filters)
+        self.cur.execute(f"EXPLAIN (ANALYZE, FORMAT JSON) {query}", params)
+        plan = self.cur.fetchall()[0][0][0]
+        return plan["Planning Time"] / 1000, plan["Execution Time"] / 1000
@@ -1,7 +1,23 @@
 from qdrant_client import QdrantClient
 from qdrant_client.http.models import (VectorParams, Distance,
-                                       PointStruct, HnswConfig)
+                                       PointStruct, HnswConfig,
+                                       OptimizersConfigDiff,
+                                       CollectionStatus, ScalarQuantization,
+                                       HnswConfigDiff, Disabled,
+                                       ScalarQuantizationConfig, ScalarType,
+                                       ProductQuantization,
+                                       ProductQuantizationConfig,
+                                       CompressionRatio, BinaryQuantization,
+                                       BinaryQuantizationConfig, SearchParams,
+                                       QuantizationSearchParams,
+                                       PayloadSchemaType, Filter,
+                                       FieldCondition, MatchValue,
+                                       PointIdsList, IntegerIndexParams,
+                                       IntegerIndexType)
 import os
+import threading
+import time
+import numpy as np
 import pandas as pd
 
 
@@ -9,6 +25,10 @@ class QDrantInterface:
     def __init__(self, data_path):
         self.data_path = data_path
         self.conn = None
+        self.table_settings = {}
+        # local mode is not thread safe, threads sharing this client take
+        # the lock around reads and writes
+        self.lock = threading.RLock()
         self.connect_server()
         pass
 
@@ -18,29 +38,128 @@ class QDrantInterface:
     def disconnect_server(self):
         self.conn = self.conn.close()
 
+    def new_connection(self):
+        # local mode locks its data path to a single client, so threads
+        # share this one
+        return self
+
+    def async_interface(self, concurrency=1, k=1):
+        from interfaces.async_qdrant_interface import AsyncQDrantInterface
+        return AsyncQDrantInterface(self.data_path, self.table_settings)
+
     def create_table(self, collection_name, vector_size, metric="Cosine",
-                     index_types=None):
+                     index_types=None, build_index=True,
+                     compression="none", rescore=True, metadata_fields=None,
+                     partition_key=None):
+        # compression "scalar", "product" or "binary" turns on qdrant's
+        # quantization, rescore re-ranks the candidates with full vectors.
+        # Local mode searches the full vectors and ignores both.
+        # The payload index of partition_key only serves exact matches
+        compression, quantization_config = \
+            self._get_quantization_config(compression)
+        self.table_settings[collection_name] = {
+            "compression": compression,
+            "rescore": rescore
+        }
         if metric == "Cosine":
             dist = Distance.COSINE
         elif metric == "L2":
             dist = Distance.EUCLID
+        elif metric == "Dot":
+            dist = Distance.DOT
+        index_config = None
         if index_types is not None:
             index_config = HnswConfig(
                 m=16,
                 ef_construct=64,
                 full_scan_threshold=1000
             )
+        optimizers_config = None
+        if not build_index:
+            # indexing_threshold=0 keeps the optimizer from building the
+            # HNSW graph until indexing_data turns it back on
+            optimizers_config = OptimizersConfigDiff(indexing_threshold=0)
         self.conn.create_collection(
             collection_name=collection_name,
             vectors_config=VectorParams(size=vector_size,
                                         distance=dist),
-            hnsw_config=index_config
+            hnsw_config=index_config,
+            optimizers_config=optimizers_config,
+            quantization_config=quantization_config
+        )
+        for field in metadata_fields or []:
+            field_schema = PayloadSchemaType.INTEGER
+            if field == partition_key:
+                field_schema = IntegerIndexParams(
+                    type=IntegerIndexType.INTEGER, lookup=True, range=False)
+            self.conn.create_payload_index(
+                collection_name=collection_name,
+                field_name=field,
+                field_schema=field_schema
+            )
+
+    def _get_quantization_config(self, compression):
+        if compression == "scalar":
+            return compression, ScalarQuantization(
+                scalar=ScalarQuantizationConfig(type=ScalarType.INT8,
+                                                always_ram=True))
+        if compression == "product":
+            return compression, ProductQuantization(
+                product=ProductQuantizationConfig(
+                    compression=CompressionRatio.X16, always_ram=True))
+        if compression == "binary":
+            return compression, BinaryQuantization(
+                binary=BinaryQuantizationConfig(always_ram=True))
+        if compression != "none":
+            print(f"Unknown compression {compression}, using none")
+        return "none", None
+
+    def indexing_data(self, collection_name, metric=None, index_types=None):
+        # m=16 builds the graph again after reset_index
+        self.conn.update_collection(
+            collection_name=collection_name,
+            hnsw_config=HnswConfigDiff(m=16, ef_construct=64),
+            optimizers_config=OptimizersConfigDiff(indexing_threshold=20000)
         )
 
+    def get_load_key(self, metric, compression):
+        # the distance is fixed when the collection is created, the
+        # quantization can be changed afterwards
+        return (metric,)
+
+    def reset_index(self, collection_name, metric, compression, rescore=True):
+        # m=0 makes the optimizer rebuild the segments without the HNSW
+        # graph, indexing_data turns it back on. Local mode has no index
+        compression, quantization_config = \
+            self._get_quantization_config(compression)
+        self.conn.update_collection(
+            collection_name=collection_name,
+            hnsw_config=HnswConfigDiff(m=0),
+            optimizers_config=OptimizersConfigDiff(indexing_threshold=0),
+            quantization_config=quantization_config or Disabled.DISABLED
+        )
+        self.wait_index_ready(collection_name)
+        self.table_settings[collection_name] = {
+            "compression": compression,
+            "rescore": rescore
+        }
+
+    def wait_index_ready(self, collection_name, timeout=600):
+        # the optimizer builds the index in the background, the collection
+        # turns green once it is done (local mode is always green)
+        start_time = time.time()
+        while time.time() - start_time < timeout:
+            info = self.conn.get_collection(collection_name)
+            if info.status == CollectionStatus.GREEN:
+                return True
+            time.sleep(0.1)
+        return False
+
     def drop_table(self, collection_name):
         self.conn.delete_collection(
             collection_name=collection_name
         )
+        self.table_settings.pop(collection_name, None)
 
     def _get_directory_size(self, directory):
         total_size = 0
@@ -57,21 +176,76 @@ class QDrantInterface:
         # print(qdrant_data_size)
         return qdrant_data_size
 
-    def insert_single_vector(self, collection_name, vector):
-        self.conn.upsert(
-            collection_name=collection_name,
-            points=[PointStruct(id=1, vector=vector.tolist())]
-        )
+    def get_total_size(self, collection_names):
+        return sum(self.get_size_of_table(collection_name)
+                   for collection_name in collection_names)
 
-    def transfer_csv(self, csv_path):
-        df = pd.read_csv(csv_path)
-        vectors = df.to_numpy()
-        data = [PointStruct(id=i, vector=vector.tolist())
+    def get_size_breakdown(self, collection_name):
+        total = self.get_size_of_table(collection_name)
+        info = self.conn.get_collection(collection_name)
+        rows = info.points_count
+        vector = rows * info.config.params.vectors.size * 4
+        # local mode keeps points in sqlite and searches them
+        # exhaustively, so there is no index on disk
+        return {
+            "total_bytes": total,
+            "vector_bytes": vector,
+            "index_bytes": 0,
+            "meta_bytes": max(total - vector, 0),
+            "bytes_per_vector": total / rows if rows > 0 else 0
+        }
+
+    def insert_single_vector(self, collection_name, vector, id):
+        with self.lock:
+            self.conn.upsert(
+                collection_name=collection_name,
+                points=[PointStruct(id=int(id), vector=vector.tolist())]
+            )
+
+    def transfer_vectors(self, vectors, start_id=0, metadata=None,
+                         ids=None):
+        if ids is None:
+            ids = range(start_id, start_id + vectors.shape[0])
+        ids = [int(id) for id in ids]
+        if metadata is not None:
+            return [PointStruct(id=ids[i], vector=vector.tolist(),
+                                payload=metadata[i])
+                    for i, vector in enumerate(vectors)]
+        data = [PointStruct(id=ids[i], vector=vector.tolist())
                 for i, vector in enumerate(vectors)]
         return data
 
+    def transfer_csv(self, csv_path, metadata_path=None, normalize=False):
+        df = pd.read_csv(csv_path)
+        vectors = df.to_numpy()
+        if normalize:
+            # unit vectors, so the Dot distance is the cosine
+            vectors = vectors / np.linalg.norm(vectors, axis=1,
+                                               keepdims=True)
+        metadata = None
+        if metadata_path is not None:
+            metadata = pd.read_csv(metadata_path).to_dict("records")
+        return self.transfer_vectors(vectors, metadata=metadata)
+
     def insert_vector_from_csv(self, collection_name, points):
-        self.conn.upsert(collection_name=collection_name, points=points)
+        with self.lock:
+            self.conn.upsert(collection_name=collection_name, points=points)
+
+    def update_vectors(self, collection_name, points):
+        # upsert replaces the points with the same ids
+        with self.lock:
+            self.conn.upsert(collection_name=collection_name, points=points)
+
+    def delete_vectors(self, collection_name, ids):
+        with self.lock:
+            self.conn.delete(
+                collection_name=collection_name,
+                points_selector=PointIdsList(points=[int(id) for id in ids])
+            )
+
+    def compact_table(self, collection_name, full=False, timeout=600):
+        # the optimizer vacuums deleted points on its own, wait for it
+        return self.wait_index_ready(collection_name, timeout=timeout)
 
     def get_rows_cnt(self, collection_name):
         collection_info = self.conn.get_collection(collection_name)
@@ -80,16 +254,39 @@ class QDrantInterface:
         return collection_info.points_count
 
     def similarity_search(self, collection_name, embedding_vector,
-                          metric='Cosine', limit=5):
+                          metric='Cosine', k=1, filters=None):
+        # returns the ids and scores of the k nearest points as arrays
         if metric == "Cosine":
             dist = "Cosine"
         elif metric == "L2":
             dist = "Euclid"
-        res = self.conn.search(
-            collection_name=collection_name,
-            query_vector=embedding_vector,
-            limit=limit,
-            search_params={"distance": dist}
-        )
-        result = [{"id": match.id, "score": match.score} for match in res]
-        return result[0]["id"], result[0]["score"]
+        elif metric == "Dot":
+            dist = "Dot"
+        search_params = {"distance": dist}
+        settings = self.table_settings.get(collection_name,
+                                           {"compression": "none"})
+        if settings["compression"] != "none":
+            search_params = SearchParams(
+                quantization=QuantizationSearchParams(
+                    rescore=settings["rescore"],
+                    oversampling=2.0 if settings["rescore"] else None))
+        # filters are {field: value} pairs that all have to match
+        query_filter = None
+        if filters:
+            query_filter = Filter(must=[
+                FieldCondition(key=field, match=MatchValue(value=value))
+                for field, value in filters.items()
+            ])
+        with self.lock:
+            res = self.conn.search(
+                collection_name=collection_name,
+                query_vector=embedding_vector.tolist(),
+                query_filter=query_filter,
+                limit=k,
+                search_params=search_params
+            )
+        ids = np.fromiter((match.id for match in res), dtype=np.int64,
+                          count=len(res))
+        scores = np.fromiter((match.score for match in res), dtype=np.float32,
+                             count=len(res))
+        return ids, scores
@@ -1,4 +1,15 @@
+# Plots of the benchmark results. The GUI shows them one at a time,
+#
+#   python3 plotting.py OUT_DIR RESULT_FILE [RESULT_FILE ...]
+#
+# renders every plot of every result file to OUT_DIR without a display
+
+import argparse
 import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+import matplotlib
 import matplotlib.pyplot as plt
 import numpy as np
 
@@ -24,7 +35,23 @@ def extract_data(data, metric):
     return results, methods
 
 
-def generate_figure(data, methods, title, ylabel):
+# extract the confidence intervals as (lower, upper) error bar lengths,
+# results without per-round statistics have no error bars
+def extract_errors(data, metric):
+    errors = {}
+    for item in data:
+        database = item['Name']
+        for method, method_results in item['Methods'].items():
+            stats = method_results.get('stats', {}).get(metric)
+            if stats is None:
+                continue
+            errors.setdefault(database, {})[method] = (
+                max(stats['mean'] - stats['ci_low'], 0),
+                max(stats['ci_high'] - stats['mean'], 0))
+    return errors
+
+
+def generate_figure(data, methods, title, ylabel, errors=None):
     fig, ax = plt.subplots(figsize=(12, 8))
 
     databases = list(data.keys())
@@ -33,8 +60,14 @@ def generate_figure(data, methods, title, ylabel):
 
     for i, method in enumerate(sorted(methods)):
         values = [data[database].get(method, 0) for database in databases]
+        yerr = None
+        if errors:
+            bars = [errors.get(database, {}).get(method, (np.nan, np.nan))
+                    for database in databases]
+            yerr = np.array(bars).T
         if any(values):
-            ax.bar(x + i * bar_width, values, bar_width, label=method)
+            ax.bar(x + i * bar_width, values, bar_width, label=method,
+                   yerr=yerr, capsize=3)
 
     ax.set_xticks(x + bar_width * (len(methods) - 1) / 2)
     ax.set_xticklabels(databases)
@@ -50,9 +83,17 @@ def generate_figure(data, methods, title, ylabel):
 metrics_labels = {
     'create_time': ('Create Time Comparison', 'Time (s)'),
     'insert_time': ('Loading Time Comparison', 'Vector per second'),
+    'index_time': ('Index Build Time Comparison', 'Time (s)'),
+    'index_ready_time': ('Index Ready Time Comparison', 'Time (s)'),
+    'ingest_time': ('Total Ingest Time Comparison', 'Time (s)'),
     'similarity_time': ('Similarity Time Comparison', 'Vector per second'),
     'size': ('Size Comparison', 'Size (bytes)'),
-    'total_distance': ('Distance (Error)', 'Vector per second')
+    'total_distance': ('Distance (Error)', 'Vector per second'),
+    'recall': ('Recall Comparison', 'Recall@1'),
+    'cold_similarity_time': ('Cold Start Similarity Comparison',
+                             'Vector per second'),
+    'cold_first_query_time': ('Cold Start First Query', 'Time (s)'),
+    'reconnect_time': ('Reconnect Time Comparison', 'Time (s)')
 }
 
 
@@ -88,9 +129,238 @@ def get_plot_figure(metric, file_path):
     title, ylabel = metrics_labels[metric]
     data_extracted, methods = extract_data(data, metric)
     if metric != 'total_distance':
-        fig = generate_figure(data_extracted, methods, title, ylabel)
+        errors = extract_errors(data, metric)
+        fig = generate_figure(data_extracted, methods, title, ylabel, errors)
     else:
         data_extracted2, methods = extract_data(data, "similarity_time")
         fig = generate_figure_quality(data_extracted, data_extracted2,
                                       methods, title, ylabel)
     return fig
+
+
+# results of workloads that did not run are empty or zero
+def has_metric(data, metric, every_method=False):
+    values = [method_results.get(metric) for item in data
+              for method_results in item['Methods'].values()]
+    if every_method and None in values:
+        return False
+    return any(value not in [None, {}, [], 0] for value in values)
+
+
+# the Pareto front of (recall, qps) points: no other point has both a
+# higher recall and a higher qps
+def pareto_front(points):
+    front = []
+    best_qps = -np.inf
+    for recall, qps in sorted(points, key=lambda p: (-p[0], -p[1])):
+        if qps > best_qps:
+            front.append((recall, qps))
+            best_qps = qps
+    return front[::-1]
+
+
+# recall@k against queries per second of every method, one point per method
+# and result file (e.g. one file per ef_search or probes setting), with the
+# front of every database
+def generate_pareto_figure(datas, labels=None):
+    fig, ax = plt.subplots(figsize=(12, 8))
+    points = {}
+    for i, data in enumerate(datas):
+        for item in data:
+            for method, method_results in item['Methods'].items():
+                if 'recall' not in method_results:
+                    continue
+                label = f"{item['Name']}+{method}"
+                if labels is not None and len(datas) > 1:
+                    label = f"{label} ({labels[i]})"
+                point = (method_results['recall'],
+                         method_results['similarity_time'])
+                points.setdefault(item['Name'], []).append(point)
+                ax.scatter(*point, label=label, s=20)
+
+    for database, database_points in points.items():
+        front = pareto_front(database_points)
+        ax.plot([p[0] for p in front], [p[1] for p in front], '--',
+                label=f"{database} Pareto front")
+    ax.set_xlabel('Recall@k')
+    ax.set_ylabel('Queries per second')
+    ax.set_yscale('log')
+    ax.set_title('Recall / Throughput Trade-off')
+    ax.legend(fontsize='small')
+    ax.grid(True)
+    return fig
+
+
+# the latency CDF of the search phase of every method
+def generate_latency_cdf_figure(data):
+    fig, ax = plt.subplots(figsize=(12, 8))
+    percentiles = np.arange(101) / 100
+    for item in data:
+        for method, method_results in item['Methods'].items():
+            cdf = method_results.get('search_latency', {}).get('cdf')
+            if not cdf:
+                continue
+            ax.plot(np.array(cdf) * 1000, percentiles,
+                    label=f"{item['Name']}+{method}")
+    ax.set_xlabel('Latency (ms)')
+    ax.set_ylabel('Fraction of queries')
+    ax.set_xscale('log')
+    ax.set_title('Search Latency CDF')
+    ax.legend(fontsize='small')
+    ax.grid(True)
+    return fig
+
+
+# queries per second of the asyncio client at every concurrency
+def generate_concurrency_figure(data):
+    fig, ax = plt.subplots(figsize=(12, 8))
+    for item in data:
+        for method, method_results in item['Methods'].items():
+            pipelined = method_results.get('async_search')
+            if not pipelined:
+                continue
+            concurrency = sorted(pipelined, key=int)
+            ax.plot([int(c) for c in concurrency],
+                    [pipelined[c]['similarity_time'] for c in concurrency],
+                    marker='o', label=f"{item['Name']}+{method}")
+    ax.set_xlabel('Queries in flight')
+    ax.set_ylabel('Queries per second')
+    ax.set_xscale('log', base=2)
+    ax.set_title('Throughput against Concurrency')
+    ax.legend(fontsize='small')
+    ax.grid(True)
+    return fig
+
+
+scale_labels = {
+    'similarity_time': 'Queries per second',
+    'recall': 'Recall@k',
+    'p99': 'p99 latency (ms)',
+    'bytes_per_vector': 'Bytes per vector'
+}
+
+
+def get_scale_value(step, measure):
+    if measure == 'p99':
+        return step['search_latency']['p99'] * 1000
+    return step[measure]
+
+
+# the measures of the scale sweep against the number of vectors
+def generate_scale_figure(data):
+    fig, axs = plt.subplots(2, 2, figsize=(16, 10))
+    for item in data:
+        for method, method_results in item['Methods'].items():
+            steps = method_results.get('scale_sweep', {}).get('checkpoints')
+            if not steps:
+                continue
+            vectors = [step['vectors'] for step in steps]
+            for ax, measure in zip(axs.flat, scale_labels):
+                ax.plot(vectors, [get_scale_value(step, measure)
+                                  for step in steps],
+                        marker='o', label=f"{item['Name']}+{method}")
+    for ax, (measure, ylabel) in zip(axs.flat, scale_labels.items()):
+        ax.set_xlabel('Vectors')
+        ax.set_ylabel(ylabel)
+        ax.set_xscale('log')
+        ax.grid(True)
+    axs.flat[0].legend(fontsize='small')
+    fig.suptitle('Metrics against Dataset Size')
+    return fig
+
+
+# the same measures across result files of different dataset sizes
+def generate_dataset_size_figure(datas):
+    fig, axs = plt.subplots(1, 2, figsize=(16, 8))
+    lines = {}
+    for data in datas:
+        for item in data:
+            size = item['Train-Data-info']['#vector']
+            for method, method_results in item['Methods'].items():
+                if 'recall' not in method_results:
+                    continue
+                lines.setdefault(f"{item['Name']}+{method}", []).append(
+                    (size, method_results['similarity_time'],
+                     method_results['recall']))
+    for label, points in lines.items():
+        points.sort()
+        axs[0].plot([p[0] for p in points], [p[1] for p in points],
+                    marker='o', label=label)
+        axs[1].plot([p[0] for p in points], [p[2] for p in points],
+                    marker='o', label=label)
+    for ax, ylabel in zip(axs, ['Queries per second', 'Recall@k']):
+        ax.set_xlabel('Vectors')
+        ax.set_ylabel(ylabel)
+        ax.set_xscale('log')
+        ax.grid(True)
+    axs[0].legend(fontsize='small')
+    fig.suptitle('Metrics against Dataset Size')
+    return fig
+
+
+def save_figure(fig, path):
+    fig.savefig(path, bbox_inches='tight')
+    plt.close(fig)
+    return path
+
+
+def render_report(file_path, out_dir):
+    # every plot of one result file as png, without a display
+    matplotlib.use("Agg")
+    data = read_json(file_path)
+    out_dir = os.path.join(out_dir,
+                           os.path.splitext(os.path.basename(file_path))[0])
+    if not os.path.exists(out_dir):
+        os.makedirs(out_dir)
+    written = []
+    for metric in metrics_labels:
+        if has_metric(data, metric, every_method=True):
+            written.append(save_figure(get_plot_figure(metric, file_path),
+                                       os.path.join(out_dir, f"{metric}.png")))
+    if has_metric(data, 'recall'):
+        written.append(save_figure(generate_pareto_figure([data]),
+                                   os.path.join(out_dir, "pareto.png")))
+    if has_metric(data, 'search_latency'):
+        written.append(save_figure(generate_latency_cdf_figure(data),
+                                   os.path.join(out_dir, "latency_cdf.png")))
+    if has_metric(data, 'async_search'):
+        written.append(save_figure(generate_concurrency_figure(data),
+                                   os.path.join(out_dir, "concurrency.png")))
+    if has_metric(data, 'scale_sweep'):
+        written.append(save_figure(generate_scale_figure(data),
+                                   os.path.join(out_dir, "scale.png")))
+    return written
+
+
+def batch_report(file_paths, out_dir, workers=None):
+    # the result files are rendered in parallel processes, the plots that
+    # compare the files are drawn at the end
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        written = [path for paths in executor.map(
+            render_report, file_paths, [out_dir] * len(file_paths))
+            for path in paths]
+    if len(file_paths) > 1:
+        matplotlib.use("Agg")
+        datas = [read_json(file_path) for file_path in file_paths]
+        labels = [os.path.splitext(os.path.basename(file_path))[0]
+                  for file_path in file_paths]
+        written.append(save_figure(generate_pareto_figure(datas, labels),
+                                   os.path.join(out_dir, "pareto.png")))
+        written.append(save_figure(generate_dataset_size_figure(datas),
+                                   os.path.join(out_dir, "dataset_size.png")))
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark plot report")
+    parser.add_argument("out_dir")
+    parser.add_argument("result_files", nargs="+")
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+    for path in batch_report(args.result_files, args.out_dir, args.workers):
+        print(path)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
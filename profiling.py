@@ -0,0 +1,139 @@
+# Attribute the time of a benchmark phase to our own code or to the client
+# library with cProfile. The profiler times the CPU of the calling thread,
+# so its functions add up to the thread's CPU time and the rest of the
+# wall time is spent waiting on I/O (the engine, the network, the disk).
+# Profiling slows down Python code, use a separate run for the numbers
+
+import cProfile
+import os
+import pstats
+import time
+from contextlib import contextmanager
+
+# code of this repository, the interfaces are counted on their own
+HARNESS_DIR = os.path.dirname(os.path.abspath(__file__))
+INTERFACE_DIR = os.path.join(HARNESS_DIR, "interfaces")
+
+# packages of the database clients and their transports
+client_packages = ["pymilvus", "milvus_lite", "qdrant_client", "psycopg2",
+                   "pgvector", "asyncpg", "grpc", "google.protobuf",
+                   "httpx", "httpcore", "h2", "portalocker"]
+
+PROFILE_KEYS = ["wall_time", "cpu_time", "io_wait", "background_cpu",
+                "harness", "interface", "client", "other"]
+
+
+def _in_client_package(text):
+    for package in client_packages:
+        # a path below the package or a method of one of its C types
+        if (f"{os.sep}{package.replace('.', os.sep)}{os.sep}" in text or
+                f"'{package}." in text):
+            return True
+    return False
+
+
+def get_category(function):
+    # function is the (file, line, name) key of pstats
+    filename, _, name = function
+    if filename == "~":
+        # built-ins, the name carries the module of C extension methods
+        return "client" if _in_client_package(name) else "other"
+    path = os.path.abspath(filename)
+    if _in_client_package(path):
+        return "client"
+    if path.startswith(INTERFACE_DIR + os.sep):
+        return "interface"
+    if (path.startswith(HARNESS_DIR + os.sep) and
+            "site-packages" not in path):
+        return "harness"
+    return "other"
+
+
+class ClientProfiler:
+    def __init__(self, enabled=False, top=15):
+        self.enabled = enabled
+        self.top = top
+        self.reset()
+
+    def reset(self):
+        # phase -> PROFILE_KEYS seconds, function -> own cpu seconds
+        self.phases = {}
+        self.functions = {}
+
+    @contextmanager
+    def phase(self, name):
+        if not self.enabled:
+            yield
+            return
+        profile = cProfile.Profile(time.thread_time)
+        start_wall = time.perf_counter()
+        start_cpu = time.thread_time()
+        start_process = time.process_time()
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+            wall_time = time.perf_counter() - start_wall
+            cpu_time = time.thread_time() - start_cpu
+            process_time = time.process_time() - start_process
+            self._add(name, pstats.Stats(profile).stats, wall_time,
+                      cpu_time, process_time)
+
+    def _add(self, name, stats, wall_time, cpu_time, process_time):
+        result = self.phases.setdefault(name,
+                                        {key: 0 for key in PROFILE_KEYS})
+        result["wall_time"] += wall_time
+        result["cpu_time"] += cpu_time
+        result["io_wait"] += max(wall_time - cpu_time, 0)
+        # other threads, e.g. the grpc pollers of the clients
+        result["background_cpu"] += max(process_time - cpu_time, 0)
+        for function, (_, _, own_time, _, _) in stats.items():
+            category = get_category(function)
+            result[category] += own_time
+            if category in ["harness", "interface"]:
+                self.functions[function] = \
+                    self.functions.get(function, 0) + own_time
+
+    def summary(self):
+        # the seconds of every phase and the share of its wall time
+        summary = {}
+        for name, result in self.phases.items():
+            summary[name] = dict(result)
+            summary[name]["share"] = {
+                key: result[key] / result["wall_time"]
+                if result["wall_time"] > 0 else 0
+                for key in ["io_wait", "harness", "interface", "client",
+                            "other"]
+            }
+        return summary
+
+    def report(self, backend):
+        lines = [f"Client side profile of {backend}",
+                 f"{'phase':<10} {'wall s':>9} {'io wait':>9} "
+                 f"{'harness':>9} {'interface':>9} {'client':>9} "
+                 f"{'other':>9} {'bg cpu s':>9}"]
+        for name, result in self.summary().items():
+            share = result["share"]
+            lines.append(
+                f"{name:<10} {result['wall_time']:>9.3f} "
+                f"{share['io_wait']:>9.1%} {share['harness']:>9.1%} "
+                f"{share['interface']:>9.1%} {share['client']:>9.1%} "
+                f"{share['other']:>9.1%} {result['background_cpu']:>9.3f}")
+        lines.append("")
+        lines.append("Slowest functions of the harness and the interfaces "
+                     "(own cpu seconds)")
+        for (filename, line, name), own_time in sorted(
+                self.functions.items(), key=lambda item: -item[1]
+        )[:self.top]:
+            path = os.path.relpath(filename, HARNESS_DIR)
+            lines.append(f"{own_time:>9.3f}  {path}:{line}({name})")
+        return "\n".join(lines)
+
+    def write_report(self, backend, profile_dir):
+        if not os.path.exists(profile_dir):
+            os.makedirs(profile_dir)
+        path = os.path.join(profile_dir, f"{backend}_profile.txt")
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(self.report(backend) + "\n")
+        return path
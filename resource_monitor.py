@@ -0,0 +1,135 @@
+# Sample memory, cpu and io usage from /proc while a benchmark phase runs
+
+import os
+import threading
+from contextlib import contextmanager
+
+CLK_TCK = os.sysconf("SC_CLK_TCK")
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+
+RESOURCE_KEYS = ["peak_rss", "avg_rss", "cpu_time",
+                 "read_bytes", "write_bytes"]
+
+
+def read_proc_stats(pid):
+    # returns (rss bytes, cpu seconds, read bytes, write bytes)
+    # or None if the process is gone
+    try:
+        with open(f"/proc/{pid}/statm", 'r') as f:
+            rss = int(f.read().split()[1]) * PAGE_SIZE
+        with open(f"/proc/{pid}/stat", 'r') as f:
+            stat = f.read()
+    except (FileNotFoundError, ProcessLookupError):
+        return None
+    # the command name can contain spaces, so split after ")"
+    fields = stat[stat.rfind(")") + 2:].split()
+    cpu_time = (int(fields[11]) + int(fields[12])) / CLK_TCK
+    read_bytes = 0
+    write_bytes = 0
+    try:
+        with open(f"/proc/{pid}/io", 'r') as f:
+            for line in f:
+                key, value = line.split(":")
+                if key == "read_bytes":
+                    read_bytes = int(value)
+                elif key == "write_bytes":
+                    write_bytes = int(value)
+    except (FileNotFoundError, PermissionError, ProcessLookupError):
+        # io of other users' processes (e.g. postgres) may be hidden
+        pass
+    return rss, cpu_time, read_bytes, write_bytes
+
+
+def get_descendants(pids):
+    # the given pids and every process below them. Milvus Lite runs its
+    # server as a child of the client and postgres serves each connection
+    # from a child of the postmaster, so those have to be looked up too
+    children = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat", 'r') as f:
+                stat = f.read()
+        except (FileNotFoundError, ProcessLookupError):
+            continue
+        ppid = int(stat[stat.rfind(")") + 2:].split()[1])
+        children.setdefault(ppid, []).append(int(entry))
+    found = []
+    pending = list(pids)
+    while len(pending) > 0:
+        pid = pending.pop()
+        if pid in found:
+            continue
+        found.append(pid)
+        pending += children.get(pid, [])
+    return found
+
+
+class ResourceMonitor:
+    def __init__(self, server_pids=None, interval=0.05):
+        # the processes are looked up again on every sample, servers and
+        # connections start and stop while the benchmark runs
+        self.pids = [os.getpid()] + [int(p) for p in (server_pids or [])]
+        self.interval = interval
+
+    def _snapshot(self):
+        return {pid: read_proc_stats(pid)
+                for pid in get_descendants(self.pids)}
+
+    def _total_rss(self):
+        total = 0
+        for pid in get_descendants(self.pids):
+            stats = read_proc_stats(pid)
+            if stats is not None:
+                total += stats[0]
+        return total
+
+    def _sample(self, stop_event, samples):
+        while True:
+            samples.append(self._total_rss())
+            if stop_event.wait(self.interval):
+                break
+
+    @contextmanager
+    def phase(self, result):
+        # fills `result` with the resource usage of the wrapped block
+        start = self._snapshot()
+        samples = []
+        stop_event = threading.Event()
+        sampler = threading.Thread(target=self._sample,
+                                   args=(stop_event, samples), daemon=True)
+        sampler.start()
+        try:
+            yield result
+        finally:
+            stop_event.set()
+            sampler.join()
+            end = self._snapshot()
+            samples.append(self._total_rss())
+            result["peak_rss"] = max(samples)
+            result["avg_rss"] = sum(samples) / len(samples)
+            result["cpu_time"] = 0
+            result["read_bytes"] = 0
+            result["write_bytes"] = 0
+            for pid, end_stats in end.items():
+                if end_stats is None:
+                    continue
+                # a process that started during the phase counts in full
+                start_stats = start.get(pid) or (0, 0, 0, 0)
+                result["cpu_time"] += end_stats[1] - start_stats[1]
+                result["read_bytes"] += end_stats[2] - start_stats[2]
+                result["write_bytes"] += end_stats[3] - start_stats[3]
+
+
+def add_resources(total, phase_result):
+    for key in RESOURCE_KEYS:
+        total[key] = total.get(key, 0) + phase_result.get(key, 0)
+    return total
+
+
+def divide_resources(total, n):
+    for key in RESOURCE_KEYS:
+        if key in total:
+            total[key] /= n
+    return total
@@ -0,0 +1,224 @@
+# Keep the history of benchmark runs in a local SQLite database and
+# compare runs with each other
+#
+#   python3 result_store.py list
+#   python3 result_store.py compare RUN_ID [BASELINE_RUN_ID]
+#   python3 result_store.py set-baseline RUN_ID
+
+import argparse
+import hashlib
+import json
+import os
+import platform
+import sqlite3
+import sys
+import time
+from importlib import metadata
+
+DEFAULT_DB_PATH = "./result/results.db"
+
+library_names = ["numpy", "pandas", "psycopg2-binary", "pgvector",
+                 "pymilvus", "milvus-lite", "qdrant-client"]
+
+# measures where a smaller value is better, the others are rates or recall
+lower_is_better = ["create_time", "index_time", "index_ready_time",
+                   "ingest_time", "size", "reconnect_time",
+                   "cold_first_query_time"]
+# better or worse depends on the metric
+ignored_measures = ["total_distance"]
+
+
+def connect(db_path=DEFAULT_DB_PATH):
+    folder = os.path.dirname(db_path)
+    if folder and not os.path.exists(folder):
+        os.makedirs(folder)
+    conn = sqlite3.connect(db_path)
+    conn.execute("""CREATE TABLE IF NOT EXISTS runs (
+        run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        started_at REAL, finished_at REAL, host TEXT, libraries TEXT,
+        parameters TEXT, dataset_fingerprint TEXT, baseline INTEGER DEFAULT 0
+    )""")
+    conn.execute("""CREATE TABLE IF NOT EXISTS results (
+        run_id INTEGER, backend TEXT, method TEXT, index_type TEXT,
+        metric TEXT, compression TEXT, round INTEGER, measure TEXT,
+        value REAL
+    )""")
+    conn.execute("""CREATE INDEX IF NOT EXISTS results_run
+        ON results (run_id, backend, method, measure)""")
+    return conn
+
+
+def get_host_info():
+    mem_total = None
+    if os.path.exists("/proc/meminfo"):
+        with open("/proc/meminfo", 'r') as f:
+            for line in f:
+                if line.startswith("MemTotal:"):
+                    mem_total = int(line.split()[1]) * 1024
+    return {
+        "hostname": platform.node(),
+        "platform": platform.platform(),
+        "processor": platform.processor(),
+        "cpu_count": os.cpu_count(),
+        "mem_total": mem_total,
+        "python": sys.version.split()[0]
+    }
+
+
+def get_library_versions():
+    versions = {}
+    for name in library_names:
+        try:
+            versions[name] = metadata.version(name)
+        except metadata.PackageNotFoundError:
+            versions[name] = None
+    return versions
+
+
+def get_dataset_fingerprint(paths, chunk_size=1 << 20):
+    # sha256 over the content of every dataset file
+    sha = hashlib.sha256()
+    for path in paths:
+        if path is None:
+            continue
+        with open(path, 'rb') as f:
+            while True:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    break
+                sha.update(chunk)
+    return sha.hexdigest()
+
+
+def save_run(db_benchmarks, parameters, dataset_paths, started_at,
+             db_path=DEFAULT_DB_PATH):
+    # one row per run, backend, method, measure and round
+    conn = connect(db_path)
+    cur = conn.execute(
+        """INSERT INTO runs (started_at, finished_at, host, libraries,
+        parameters, dataset_fingerprint) VALUES (?, ?, ?, ?, ?, ?)""",
+        (started_at, time.time(), json.dumps(get_host_info()),
+         json.dumps(get_library_versions()),
+         json.dumps(parameters, default=str),
+         get_dataset_fingerprint(dataset_paths)))
+    run_id = cur.lastrowid
+    rows = []
+    for db_BM in db_benchmarks:
+        for method, method_results in db_BM["Methods"].items():
+            index_type, metric = method.split("+")[:2]
+            compression = method_results.get("compression", "none")
+            for i, round_result in enumerate(method_results["rounds"]):
+                for measure, value in round_result.items():
+                    rows.append((run_id, db_BM["Name"], method, index_type,
+                                 metric, compression, i, measure,
+                                 float(value)))
+    conn.executemany(
+        """INSERT INTO results (run_id, backend, method, index_type, metric,
+        compression, round, measure, value)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""", rows)
+    conn.commit()
+    conn.close()
+    return run_id
+
+
+def get_run_means(conn, run_id):
+    res = conn.execute(
+        """SELECT backend, method, measure, AVG(value) FROM results
+        WHERE run_id = ? GROUP BY backend, method, measure""", (run_id,))
+    return {(backend, method, measure): value
+            for backend, method, measure, value in res.fetchall()}
+
+
+def get_baseline_run(conn):
+    res = conn.execute("""SELECT run_id FROM runs WHERE baseline = 1
+        ORDER BY run_id DESC LIMIT 1""").fetchall()
+    return res[0][0] if len(res) > 0 else None
+
+
+def compare_runs(run_id, baseline_id=None, threshold=0.05,
+                 db_path=DEFAULT_DB_PATH):
+    # returns the measures of run_id that are worse than in the baseline
+    # by more than threshold (relative)
+    conn = connect(db_path)
+    if baseline_id is None:
+        baseline_id = get_baseline_run(conn)
+    if baseline_id is None:
+        conn.close()
+        raise ValueError("No baseline run, pass one or use set-baseline")
+    fingerprints = dict(conn.execute(
+        "SELECT run_id, dataset_fingerprint FROM runs WHERE run_id IN (?, ?)",
+        (run_id, baseline_id)).fetchall())
+    if fingerprints.get(run_id) != fingerprints.get(baseline_id):
+        print("Warning: the runs used different datasets")
+    current = get_run_means(conn, run_id)
+    baseline = get_run_means(conn, baseline_id)
+    conn.close()
+
+    regressions = []
+    for key, value in sorted(current.items()):
+        if (key not in baseline or baseline[key] == 0 or
+                key[2] in ignored_measures):
+            continue
+        change = (value - baseline[key]) / abs(baseline[key])
+        if key[2] in lower_is_better:
+            change = -change
+        if change < -threshold:
+            regressions.append({
+                "backend": key[0], "method": key[1], "measure": key[2],
+                "baseline": baseline[key], "value": value,
+                "change": change
+            })
+    return regressions
+
+
+def set_baseline(run_id, db_path=DEFAULT_DB_PATH):
+    conn = connect(db_path)
+    conn.execute("UPDATE runs SET baseline = (run_id = ?)", (run_id,))
+    conn.commit()
+    conn.close()
+
+
+def list_runs(db_path=DEFAULT_DB_PATH):
+    conn = connect(db_path)
+    res = conn.execute(
+        """SELECT run_id, started_at, dataset_fingerprint, baseline
+        FROM runs ORDER BY run_id""").fetchall()
+    conn.close()
+    return res
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark result store")
+    parser.add_argument("--db", default=DEFAULT_DB_PATH)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("list")
+    compare_parser = subparsers.add_parser("compare")
+    compare_parser.add_argument("run_id", type=int)
+    compare_parser.add_argument("baseline_id", type=int, nargs="?")
+    compare_parser.add_argument("--threshold", type=float, default=0.05)
+    baseline_parser = subparsers.add_parser("set-baseline")
+    baseline_parser.add_argument("run_id", type=int)
+    args = parser.parse_args()
+
+    if args.command == "list":
+        for run_id, started_at, fingerprint, baseline in list_runs(args.db):
+            started = time.strftime("%Y-%m-%d %H:%M:%S",
+                                    time.localtime(started_at))
+            mark = " (baseline)" if baseline else ""
+            print(f"{run_id}\t{started}\t{fingerprint[:12]}{mark}")
+    elif args.command == "set-baseline":
+        set_baseline(args.run_id, args.db)
+    elif args.command == "compare":
+        regressions = compare_runs(args.run_id, args.baseline_id,
+                                   args.threshold, args.db)
+        for r in regressions:
+            print(f"{r['backend']} {r['method']} {r['measure']}: "
+                  f"{r['baseline']:.4g} -> {r['value']:.4g} "
+                  f"({r['change']:+.1%})")
+        print(f"{len(regressions)} regressions")
+        return 1 if len(regressions) > 0 else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
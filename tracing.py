@@ -0,0 +1,149 @@
+# Spans for the benchmark phases and the interface calls, exported as
+# Chrome trace events (open in Perfetto or chrome://tracing) and as a
+# summary per phase. A disabled tracer hands out one shared no-op span
+
+import functools
+import json
+import os
+import threading
+from time import perf_counter_ns
+
+# the interface calls that trace_interface wraps
+interface_methods = [
+    "connect_server", "disconnect_server", "new_connection", "create_table",
+    "indexing_data", "wait_index_ready", "reset_index", "drop_table",
+    "get_size_of_table", "get_size_breakdown", "insert_single_vector",
+    "transfer_vectors", "transfer_csv", "insert_vector_from_csv",
+    "update_vectors", "delete_vectors", "compact_table", "get_rows_cnt",
+    "similarity_search", "flush_table", "load_table", "release_table"
+]
+
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_null_span = _NullSpan()
+
+
+class _Span:
+    def __init__(self, tracer, name, category, args):
+        self.tracer = tracer
+        self.name = name
+        self.category = category
+        self.args = args
+
+    def __enter__(self):
+        self.start = perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        self.tracer.add(self.name, self.category, self.start,
+                        perf_counter_ns() - self.start, self.args)
+        return False
+
+
+class Tracer:
+    def __init__(self):
+        self.enabled = False
+        self.events = []
+        self.lock = threading.Lock()
+        self.start_ns = perf_counter_ns()
+
+    def enable(self):
+        self.events = []
+        self.start_ns = perf_counter_ns()
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def span(self, name, category="phase", **args):
+        if not self.enabled:
+            return _null_span
+        return _Span(self, name, category, args)
+
+    def add(self, name, category, start_ns, duration_ns, args=None):
+        event = (name, category, start_ns, duration_ns,
+                 threading.get_ident(), args)
+        with self.lock:
+            self.events.append(event)
+
+    def export_chrome(self, path):
+        # complete ("X") events, times in microseconds
+        pid = os.getpid()
+        trace_events = []
+        for name, category, start_ns, duration_ns, tid, args in self.events:
+            event = {"name": name, "cat": category, "ph": "X",
+                     "ts": (start_ns - self.start_ns) / 1000,
+                     "dur": duration_ns / 1000, "pid": pid, "tid": tid}
+            if args:
+                event["args"] = {key: str(value)
+                                 for key, value in args.items()}
+            trace_events.append(event)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({"traceEvents": trace_events,
+                       "displayTimeUnit": "ms"}, f)
+
+    def summary(self):
+        # (category, name) -> count and total, mean and max seconds
+        summary = {}
+        for name, category, _, duration_ns, _, _ in self.events:
+            row = summary.setdefault((category, name),
+                                     {"count": 0, "total": 0, "max": 0})
+            row["count"] += 1
+            row["total"] += duration_ns / 1e9
+            row["max"] = max(row["max"], duration_ns / 1e9)
+        for row in summary.values():
+            row["mean"] = row["total"] / row["count"]
+        return summary
+
+    def summary_table(self):
+        lines = [f"{'category':<10} {'span':<40} {'count':>8} "
+                 f"{'total s':>10} {'mean ms':>10} {'max ms':>10}"]
+        for (category, name), row in sorted(
+                self.summary().items(), key=lambda item: -item[1]["total"]):
+            lines.append(f"{category:<10} {name:<40} {row['count']:>8} "
+                         f"{row['total']:>10.3f} {row['mean'] * 1000:>10.3f} "
+                         f"{row['max'] * 1000:>10.3f}")
+        return "\n".join(lines)
+
+
+tracer = Tracer()
+
+
+def _traced(tracer, name, method):
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        with tracer.span(name, "interface"):
+            return method(*args, **kwargs)
+    wrapper.traced = True
+    return wrapper
+
+
+def trace_interface(db, tracer=tracer):
+    # wraps the interface calls of db in spans, does nothing when the
+    # tracer is disabled so the calls keep their cost
+    if not tracer.enabled:
+        return db
+    backend = type(db).__name__
+    for name in interface_methods:
+        method = getattr(db, name, None)
+        if method is None or getattr(method, "traced", False):
+            continue
+        if name == "new_connection":
+            # connections for other threads are traced as well
+            method = _traced_connection(tracer, method)
+        setattr(db, name, _traced(tracer, f"{backend}.{name}", method))
+    return db
+
+
+def _traced_connection(tracer, new_connection):
+    @functools.wraps(new_connection)
+    def wrapper():
+        return trace_interface(new_connection(), tracer)
+    return wrapper
@@ -0,0 +1,658 @@
+# Workloads that run on a collection which is already loaded by
+# benchmark_test
+
+import asyncio
+import threading
+import time
+from contextlib import nullcontext
+import numpy as np
+from numpy.linalg import norm
+
+from ground_truth import get_ground_truth, get_recall
+from datasets import as_float
+from tracing import tracer
+
+
+def get_latency_stats(latencies):
+    # cdf holds the 0th to 100th percentile, for the latency CDF plots
+    if len(latencies) == 0:
+        return {"count": 0, "mean": 0, "p50": 0, "p95": 0, "p99": 0,
+                "cdf": []}
+    latencies = np.array(latencies)
+    return {
+        "count": int(latencies.shape[0]),
+        "mean": float(np.mean(latencies)),
+        "p50": float(np.percentile(latencies, 50)),
+        "p95": float(np.percentile(latencies, 95)),
+        "p99": float(np.percentile(latencies, 99)),
+        "cdf": np.percentile(latencies, np.arange(101)).tolist()
+    }
+
+
+def add_latency_stats(total, latency):
+    # sums the stats of several rounds, divide_latency_stats averages them
+    for key, value in latency.items():
+        if key == "cdf":
+            total[key] = (np.add(total[key], value).tolist()
+                          if total.get(key) else list(value))
+        else:
+            total[key] = total.get(key, 0) + value
+
+
+def divide_latency_stats(total, count):
+    for key, value in total.items():
+        if key == "cdf":
+            total[key] = (np.array(value) / count).tolist()
+        else:
+            total[key] = value / count
+
+
+def make_new_vectors(train_vector, num_vectors, noise=0.01, rows=None,
+                     normalize=False):
+    # jittered copies of training vectors (the given rows or random ones),
+    # so the new vectors follow the same distribution without duplicating
+    # existing ones. Every row is read once and in increasing order, as
+    # HDF5 datasets require, and converted to floats. normalize puts the
+    # copies of normalized vectors back on the unit sphere
+    if rows is None:
+        rows = np.random.randint(0, train_vector.shape[0], num_vectors)
+    unique_rows, inverse = np.unique(rows, return_inverse=True)
+    source = as_float(train_vector[unique_rows])[inverse]
+    scale = noise * np.std(source)
+    new_vectors = source + np.random.normal(0, scale, size=source.shape)
+    if normalize:
+        new_vectors = new_vectors / norm(new_vectors, axis=1, keepdims=True)
+    return new_vectors
+
+
+def get_rows_metadata(metadata, rows):
+    # the metadata records of the given rows, None without metadata
+    if metadata is None:
+        return None
+    return [metadata[row] for row in rows]
+
+
+def insert_vectors(db, collection_name, vectors, batch_size=10000,
+                   normalize=False, metadata=None, start_id=0, ids=None):
+    # converts and inserts one batch at a time, so memory-mapped rows are
+    # only read with their batch. Row i gets the id start_id + i, or
+    # ids[i] when ids are given. Returns the seconds spent inserting
+    insert_time = 0
+    for start in range(0, vectors.shape[0], batch_size):
+        with tracer.span("transfer"):
+            batch = as_float(vectors[start:start + batch_size])
+            if normalize:
+                batch = batch / norm(batch, axis=1, keepdims=True)
+            batch_metadata = None
+            if metadata is not None:
+                batch_metadata = metadata[start:start + batch_size]
+            batch_ids = None
+            if ids is not None:
+                batch_ids = ids[start:start + batch_size]
+            data = db.transfer_vectors(batch, start_id=start_id + start,
+                                       metadata=batch_metadata,
+                                       ids=batch_ids)
+        with tracer.span("insert_batch"):
+            start_time = time.time()
+            db.insert_vector_from_csv(collection_name, data)
+            insert_time += time.time() - start_time
+    return insert_time
+
+
+def search_test(db, collection_name, test_vector, metric, ground_truth,
+                filters=None, k=1):
+    # returns queries per second and recall@k against ground_truth ids
+    result_ids = []
+    start_time = time.time()
+    for test_i in range(test_vector.shape[0]):
+        ids, _ = db.similarity_search(collection_name,
+                                      test_vector[test_i, :], metric, k=k,
+                                      filters=filters)
+        result_ids.append(ids)
+    search_time = time.time() - start_time
+    recall = get_recall(result_ids, ground_truth, k)
+    return test_vector.shape[0] / search_time, recall
+
+
+async def _async_search(adb, collection_name, test_vector, metric, k,
+                        concurrency):
+    # `concurrency` workers share the queries, so that many are in flight
+    result_ids = [None] * test_vector.shape[0]
+    latencies = []
+    next_query = [0]
+
+    async def worker():
+        while next_query[0] < test_vector.shape[0]:
+            test_i = next_query[0]
+            next_query[0] += 1
+            start_time = time.time()
+            ids, _ = await adb.similarity_search(
+                collection_name, test_vector[test_i, :], metric, k=k)
+            latencies.append(time.time() - start_time)
+            result_ids[test_i] = ids
+
+    await adb.connect_server()
+    try:
+        start_time = time.time()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        search_time = time.time() - start_time
+    finally:
+        await adb.disconnect_server()
+    return result_ids, search_time, latencies
+
+
+def async_search_test(db, collection_name, test_vector, metric,
+                      ground_truth, concurrency=1, k=1):
+    # search from one asyncio client with `concurrency` queries in flight,
+    # returns queries per second, recall@k and the latency stats
+    adb = db.async_interface(concurrency=concurrency, k=k)
+    # local qdrant and milvus lock their data to one client, the sync
+    # client is closed while the async one runs
+    db.disconnect_server()
+    try:
+        result_ids, search_time, latencies = asyncio.run(_async_search(
+            adb, collection_name, test_vector, metric, k, concurrency))
+    finally:
+        db.connect_server()
+    recall = get_recall(result_ids, ground_truth, k)
+    return (test_vector.shape[0] / search_time, recall,
+            get_latency_stats(latencies))
+
+
+def query_overhead_test(db, collection_name, test_vector, metric, k=1,
+                        num_queries=100):
+    # per query round trip on the client against planning and execution
+    # time reported by the server (EXPLAIN ANALYZE), for ad hoc queries
+    # and prepared statements. Only for interfaces with explain_search
+    prepared = db.prepared
+    result = {}
+    for mode, name in [(False, "adhoc"), (True, "prepared")]:
+        db.prepared = mode
+        round_trips = []
+        planning_times = []
+        execution_times = []
+        for test_i in range(num_queries):
+            vector = test_vector[test_i % test_vector.shape[0], :]
+            start_time = time.time()
+            db.similarity_search(collection_name, vector, metric, k=k)
+            round_trips.append(time.time() - start_time)
+            planning_time, execution_time = db.explain_search(
+                collection_name, vector, metric, k=k)
+            planning_times.append(planning_time)
+            execution_times.append(execution_time)
+        round_trip = float(np.mean(round_trips))
+        server_time = float(np.mean(planning_times) +
+                            np.mean(execution_times))
+        result[name] = {
+            "round_trip": round_trip,
+            "planning_time": float(np.mean(planning_times)),
+            "execution_time": float(np.mean(execution_times)),
+            "client_overhead": round_trip - server_time
+        }
+    db.prepared = prepared
+    return result
+
+
+def mixed_workload_test(db, collection_name, metric, train_vector,
+                        test_vector, insert_rate=100, batch_size=10,
+                        num_searchers=2, duration=10, visibility_every=10,
+                        visibility_timeout=10, metadata=None,
+                        normalize=False):
+    # insert new vectors at `insert_rate` vectors per second in batches of
+    # `batch_size` while `num_searchers` threads keep querying. metadata
+    # holds the records of the training rows when the collection has
+    # metadata fields, a new vector gets the metadata of the row it copies.
+    # normalize is set for the collections of normalized vectors
+    start_id = train_vector.shape[0]
+    max_vectors = int(insert_rate * duration) + batch_size
+    source_rows = np.random.randint(0, train_vector.shape[0], max_vectors)
+    new_vectors = make_new_vectors(train_vector, max_vectors,
+                                   rows=source_rows, normalize=normalize)
+    new_metadata = get_rows_metadata(metadata, source_rows)
+    stop_event = threading.Event()
+    writer_done = threading.Event()
+    search_latencies = [[] for _ in range(num_searchers)]
+    visibility_latencies = []
+    probes = []
+    probes_lock = threading.Lock()
+    inserted = [0]
+    probe_count = [0]
+    errors = []
+
+    def writer():
+        writer_db = db.new_connection()
+        try:
+            start_time = time.time()
+            batch_i = 0
+            while not stop_event.is_set() and inserted[0] < max_vectors:
+                # wait until the rate allows the next batch
+                next_time = start_time + inserted[0] / insert_rate
+                delay = next_time - time.time()
+                if delay > 0 and stop_event.wait(delay):
+                    break
+                batch = new_vectors[inserted[0]:inserted[0] + batch_size]
+                batch_metadata = None
+                if new_metadata is not None:
+                    batch_metadata = new_metadata[inserted[0]:
+                                                  inserted[0] + batch_size]
+                data = writer_db.transfer_vectors(
+                    batch, start_id=start_id + inserted[0],
+                    metadata=batch_metadata)
+                writer_db.insert_vector_from_csv(collection_name, data)
+                if batch_i % visibility_every == 0:
+                    with probes_lock:
+                        probes.append((start_id + inserted[0], batch[0],
+                                       time.time()))
+                    probe_count[0] += 1
+                inserted[0] += batch.shape[0]
+                batch_i += 1
+        except Exception as e:
+            errors.append(f"writer: {e}")
+        finally:
+            writer_done.set()
+            if writer_db is not db:
+                writer_db.disconnect_server()
+
+    def searcher(latencies):
+        searcher_db = db.new_connection()
+        try:
+            test_i = 0
+            while not stop_event.is_set():
+                start_time = time.time()
+                searcher_db.similarity_search(
+                    collection_name, test_vector[test_i, :], metric)
+                latencies.append(time.time() - start_time)
+                test_i = (test_i + 1) % test_vector.shape[0]
+        except Exception as e:
+            errors.append(f"searcher: {e}")
+        finally:
+            if searcher_db is not db:
+                searcher_db.disconnect_server()
+
+    def visibility_checker():
+        # poll until a new vector is its own nearest neighbour
+        checker_db = db.new_connection()
+        try:
+            while not writer_done.is_set() or len(probes) > 0:
+                with probes_lock:
+                    probe = probes.pop(0) if len(probes) > 0 else None
+                if probe is None:
+                    time.sleep(0.01)
+                    continue
+                id, vector, insert_time = probe
+                while time.time() - insert_time < visibility_timeout:
+                    found_ids, _ = checker_db.similarity_search(
+                        collection_name, vector, metric)
+                    if len(found_ids) > 0 and found_ids[0] == id:
+                        visibility_latencies.append(time.time() -
+                                                    insert_time)
+                        break
+                    time.sleep(0.001)
+        except Exception as e:
+            errors.append(f"visibility: {e}")
+        finally:
+            if checker_db is not db:
+                checker_db.disconnect_server()
+
+    threads = [threading.Thread(target=writer, daemon=True),
+               threading.Thread(target=visibility_checker, daemon=True)]
+    threads += [threading.Thread(target=searcher, args=(latencies,),
+                                 daemon=True)
+                for latencies in search_latencies]
+    with tracer.span("mixed_workload"):
+        start_time = time.time()
+        for thread in threads:
+            thread.start()
+        time.sleep(duration)
+        stop_event.set()
+        # the rates cover the time the writer and searchers ran, not the
+        # visibility checks still draining after the stop
+        elapsed = time.time() - start_time
+        for thread in threads:
+            thread.join()
+
+    all_latencies = [latency for latencies in search_latencies
+                     for latency in latencies]
+    result = {
+        "target_insert_rate": insert_rate,
+        "insert_rate": inserted[0] / elapsed,
+        "inserted": inserted[0],
+        "search_qps": len(all_latencies) / elapsed,
+        "search_latency": get_latency_stats(all_latencies),
+        "visibility_latency": get_latency_stats(visibility_latencies),
+        "not_visible": probe_count[0] - len(visibility_latencies),
+        "errors": errors
+    }
+    return result
+
+
+def churn_workload_test(db, collection_name, metric, train_vector,
+                        test_vector, churn_fraction=1.0, steps=5,
+                        update_ratio=0.5, batch_size=1000,
+                        full_compaction=False, metadata=None,
+                        normalize=False):
+    # replace churn_fraction of the collection in `steps` steps. In every
+    # step update_ratio of the replaced vectors are updated by id and the
+    # rest are deleted and inserted again under new ids. metadata holds
+    # the records of the training rows when the collection has metadata
+    # fields, a replacement keeps the metadata of the row it replaces.
+    # normalize is set for the collections of normalized vectors
+    live_ids = np.arange(train_vector.shape[0])
+    # a float copy in memory, the replacements are written into it
+    live_vectors = np.array(as_float(train_vector))
+    next_id = train_vector.shape[0]
+    step_size = int(train_vector.shape[0] * churn_fraction / steps)
+
+    def checkpoint(churned):
+        with tracer.span("churn_checkpoint", churned=churned):
+            return measure(churned)
+
+    def measure(churned):
+        ground_truth = live_ids[get_ground_truth(live_vectors, test_vector,
+                                                 metric)[:, 0]]
+        qps, recall = search_test(db, collection_name, test_vector, metric,
+                                  ground_truth)
+        size = db.get_size_of_table(collection_name)
+        print(f"churn {churned:.2f}: {qps = }, {recall = }, {size = }")
+        return {"churned_fraction": churned, "similarity_time": qps,
+                "recall": recall, "size": size}
+
+    result = {"steps": [checkpoint(0.0)], "update_time": 0,
+              "delete_time": 0, "insert_time": 0}
+    for step in range(steps):
+        rows = np.random.choice(live_ids.shape[0], step_size, replace=False)
+        num_updates = int(step_size * update_ratio)
+        update_rows = rows[:num_updates]
+        replace_rows = rows[num_updates:]
+        new_vectors = make_new_vectors(train_vector, step_size,
+                                       normalize=normalize)
+
+        with tracer.span("churn_update"):
+            start_time = time.time()
+            for start in range(0, update_rows.shape[0], batch_size):
+                batch = update_rows[start:start + batch_size]
+                data = db.transfer_vectors(
+                    new_vectors[start:start + len(batch)],
+                    ids=live_ids[batch],
+                    metadata=get_rows_metadata(metadata, batch))
+                db.update_vectors(collection_name, data)
+            result["update_time"] += time.time() - start_time
+        live_vectors[update_rows] = new_vectors[:num_updates]
+
+        with tracer.span("churn_delete"):
+            start_time = time.time()
+            for start in range(0, replace_rows.shape[0], batch_size):
+                batch = replace_rows[start:start + batch_size]
+                db.delete_vectors(collection_name, live_ids[batch])
+            result["delete_time"] += time.time() - start_time
+
+        new_ids = np.arange(next_id, next_id + replace_rows.shape[0])
+        next_id += replace_rows.shape[0]
+        with tracer.span("churn_insert"):
+            start_time = time.time()
+            for start in range(0, replace_rows.shape[0], batch_size):
+                vectors = new_vectors[num_updates + start:
+                                      num_updates + start + batch_size]
+                batch = replace_rows[start:start + batch_size]
+                data = db.transfer_vectors(
+                    vectors, ids=new_ids[start:start + batch_size],
+                    metadata=get_rows_metadata(metadata, batch))
+                db.insert_vector_from_csv(collection_name, data)
+            result["insert_time"] += time.time() - start_time
+        live_ids[replace_rows] = new_ids
+        live_vectors[replace_rows] = new_vectors[num_updates:]
+
+        result["steps"].append(checkpoint((step + 1) * step_size /
+                                          train_vector.shape[0]))
+
+    # vacuum or compaction, then measure again
+    with tracer.span("compaction"):
+        start_time = time.time()
+        result["compacted"] = db.compact_table(collection_name,
+                                               full=full_compaction)
+        result["compaction_time"] = time.time() - start_time
+    result["after_compaction"] = checkpoint(steps * step_size /
+                                            train_vector.shape[0])
+    return result
+
+
+def scale_test(db, collection_name, metric, index_type, train_vector,
+               test_vector, checkpoints, k=1, batch_size=10000,
+               compression="none", rescore=True):
+    # grow one collection through the checkpoints (numbers of vectors),
+    # the index is kept up to date while inserting. At every checkpoint
+    # the search speed, latency, recall@k and size are measured before
+    # the next vectors are inserted. IVF indexes learn their lists from
+    # the rows in the table, they are built after the first checkpoint's
+    # insert (its index_ready_time includes the build) and the later rows
+    # are added to those lists
+    checkpoints = sorted(set(min(int(c), train_vector.shape[0])
+                             for c in checkpoints))
+    trained = str(index_type).lower().startswith("ivf")
+    db.drop_table(collection_name)
+    db.create_table(collection_name, test_vector.shape[1], metric=metric,
+                    index_types=index_type, build_index=not trained,
+                    compression=compression, rescore=rescore)
+    result = {"checkpoints": []}
+    loaded = 0
+    for checkpoint in checkpoints:
+        with tracer.span("scale_insert", vectors=checkpoint):
+            insert_time = insert_vectors(
+                db, collection_name, train_vector[loaded:checkpoint],
+                batch_size=batch_size, start_id=loaded)
+            start_time = time.time()
+            if trained and loaded == 0:
+                db.indexing_data(collection_name, metric, index_type)
+            db.wait_index_ready(collection_name)
+            index_ready_time = time.time() - start_time
+        new_vectors = checkpoint - loaded
+        loaded = checkpoint
+
+        ground_truth = get_ground_truth(train_vector[:loaded], test_vector,
+                                        metric, k=k)
+        result_ids = []
+        latencies = []
+        with tracer.span("scale_search", vectors=checkpoint):
+            for test_i in range(test_vector.shape[0]):
+                start_time = time.time()
+                ids, _ = db.similarity_search(
+                    collection_name, test_vector[test_i, :], metric, k=k)
+                latencies.append(time.time() - start_time)
+                result_ids.append(ids)
+        size = db.get_size_of_table(collection_name)
+        step = {
+            "vectors": loaded,
+            "insert_time": new_vectors / insert_time if insert_time > 0
+            else 0,
+            "index_ready_time": index_ready_time,
+            "similarity_time": len(latencies) / sum(latencies),
+            "search_latency": get_latency_stats(latencies),
+            "recall": get_recall(result_ids, ground_truth, k),
+            "size": size,
+            "bytes_per_vector": size / loaded
+        }
+        print(f"{loaded} vectors: qps = {step['similarity_time']}, "
+              f"recall = {step['recall']}, {size = }")
+        result["checkpoints"].append(step)
+    return result
+
+
+def segment_lifecycle_test(db, collection_name, metric, index_type,
+                           train_vector, test_vector, ground_truth, k=1,
+                           batch_size=10000, compression="none"):
+    # Milvus only: times flush, index, release, load and compaction and
+    # searches the same rows twice, first while they are still in growing
+    # segments (no flush, searched without the index) and then once they
+    # are flushed into sealed, indexed segments
+    def measure():
+        result_ids = []
+        latencies = []
+        for test_i in range(test_vector.shape[0]):
+            start_time = time.time()
+            ids, _ = db.similarity_search(
+                collection_name, test_vector[test_i, :], metric, k=k)
+            latencies.append(time.time() - start_time)
+            result_ids.append(ids)
+        return {
+            "similarity_time": len(latencies) / sum(latencies),
+            "search_latency": get_latency_stats(latencies),
+            "recall": get_recall(result_ids, ground_truth, k),
+            "segments": db.get_segment_states(collection_name)
+        }
+
+    result = {}
+    db.drop_table(collection_name)
+    db.create_table(collection_name, test_vector.shape[1], metric=metric,
+                    index_types=index_type, build_index=False,
+                    compression=compression)
+    insert_time = insert_vectors(db, collection_name, train_vector,
+                                 batch_size=batch_size)
+    result["insert_time"] = (train_vector.shape[0] / insert_time
+                             if insert_time > 0 else 0)
+    with tracer.span("growing_search"):
+        db.indexing_data(collection_name, metric, index_type)
+        start_time = time.time()
+        db.load_table(collection_name)
+        result["growing_load_time"] = time.time() - start_time
+        result["growing"] = measure()
+
+    with tracer.span("flush"):
+        start_time = time.time()
+        db.flush_table(collection_name)
+        result["flush_time"] = time.time() - start_time
+    with tracer.span("index_ready"):
+        start_time = time.time()
+        db.wait_index_ready(collection_name)
+        result["index_ready_time"] = time.time() - start_time
+    with tracer.span("release"):
+        start_time = time.time()
+        db.release_table(collection_name)
+        result["release_time"] = time.time() - start_time
+    with tracer.span("load"):
+        start_time = time.time()
+        db.load_table(collection_name)
+        result["load_time"] = time.time() - start_time
+    with tracer.span("sealed_search"):
+        result["sealed"] = measure()
+
+    with tracer.span("compaction"):
+        start_time = time.time()
+        result["compacted"] = db.compact_table(collection_name)
+        result["compaction_time"] = time.time() - start_time
+    return result
+
+
+tenant_layouts = ["collections", "shared"]
+
+
+def multi_tenant_test(db, collection_name, metric, index_type, train_vector,
+                      test_vector, tenant_counts, layouts=None, k=1,
+                      batch_size=10000, compression="none", monitor=None):
+    # spreads the rows over N tenants (row i belongs to tenant i % N) for
+    # every N of tenant_counts, in every layout:
+    #   "collections": one collection or table per tenant
+    #   "shared": one collection with a tenant field, partition key and
+    #             index, searched with a tenant filter
+    # Query i searches the rows of tenant i % N. Reports the create and
+    # index time, insert speed, search speed and latency, recall@k, the
+    # total size (None where the backend can not attribute it) and the
+    # memory (with a ResourceMonitor)
+    layouts = layouts or tenant_layouts
+    result = {layout: [] for layout in layouts}
+    # the collection loaded by benchmark_test would stay in memory and on
+    # disk next to the per tenant collections
+    db.drop_table(collection_name)
+    for num_tenants in tenant_counts:
+        tenants = np.arange(train_vector.shape[0]) % num_tenants
+        query_tenants = np.arange(test_vector.shape[0]) % num_tenants
+        tenant_k = min(k, int(np.bincount(tenants).min()))
+        # the exact neighbours among the rows of the tenant, as row ids
+        ground_truth = np.zeros((test_vector.shape[0], tenant_k),
+                                dtype=np.int64)
+        for tenant in range(num_tenants):
+            queries = np.flatnonzero(query_tenants == tenant)
+            if queries.shape[0] == 0:
+                continue
+            rows = np.flatnonzero(tenants == tenant)
+            ground_truth[queries] = rows[get_ground_truth(
+                as_float(train_vector[rows]), test_vector[queries], metric,
+                k=tenant_k)]
+
+        for layout in layouts:
+            if layout == "collections":
+                names = [f"{collection_name}_tenant_{tenant}"
+                         for tenant in range(num_tenants)]
+            elif layout == "shared":
+                names = [collection_name]
+            else:
+                raise ValueError(f"Unknown layout {layout}, use one of "
+                                 f"{tenant_layouts}")
+            resources = {}
+            phase = monitor.phase(resources) if monitor is not None \
+                else nullcontext()
+            with tracer.span("multi_tenant", layout=layout,
+                             tenants=num_tenants), phase:
+                step = {"tenants": num_tenants}
+                start_time = time.time()
+                for name in names:
+                    db.drop_table(name)
+                    db.create_table(
+                        name, test_vector.shape[1], metric=metric,
+                        index_types=index_type, build_index=False,
+                        compression=compression,
+                        metadata_fields=["tenant"] if layout == "shared"
+                        else None,
+                        partition_key="tenant" if layout == "shared"
+                        else None)
+                step["create_time"] = time.time() - start_time
+
+                insert_time = 0
+                if layout == "shared":
+                    insert_time += insert_vectors(
+                        db, collection_name, train_vector,
+                        batch_size=batch_size,
+                        metadata=[{"tenant": int(tenant)}
+                                  for tenant in tenants])
+                else:
+                    for tenant, name in enumerate(names):
+                        rows = np.flatnonzero(tenants == tenant)
+                        insert_time += insert_vectors(
+                            db, name, train_vector[rows],
+                            batch_size=batch_size, ids=rows)
+                step["insert_time"] = (train_vector.shape[0] / insert_time
+                                       if insert_time > 0 else 0)
+
+                start_time = time.time()
+                for name in names:
+                    db.indexing_data(name, metric, index_type)
+                for name in names:
+                    db.wait_index_ready(name)
+                step["index_time"] = time.time() - start_time
+
+                result_ids = []
+                latencies = []
+                for test_i in range(test_vector.shape[0]):
+                    tenant = int(query_tenants[test_i])
+                    if layout == "shared":
+                        name, filters = collection_name, {"tenant": tenant}
+                    else:
+                        name, filters = names[tenant], None
+                    start_time = time.time()
+                    ids, _ = db.similarity_search(
+                        name, test_vector[test_i, :], metric, k=tenant_k,
+                        filters=filters)
+                    latencies.append(time.time() - start_time)
+                    result_ids.append(ids)
+                step["similarity_time"] = len(latencies) / sum(latencies)
+                step["search_latency"] = get_latency_stats(latencies)
+                step["recall"] = get_recall(result_ids, ground_truth,
+                                            tenant_k)
+                step["size"] = db.get_total_size(names)
+            step["resources"] = resources
+            print(f"{layout}, {num_tenants} tenants: "
+                  f"qps = {step['similarity_time']}, "
+                  f"recall = {step['recall']}, size = {step['size']}")
+            result[layout].append(step)
+            for name in names:
+                db.drop_table(name)
+    return result